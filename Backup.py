@@ -1,12 +1,23 @@
+import hashlib
+import json
 import logging
 import os
 import shutil
+import zipfile
+from FileManifest import FileManifest
 
 
 class Backup:
-    def __init__(self, src_dir, dest_dir):
+    MANIFEST_SUFFIX = '_manifest.json'
+    ARCHIVE_EXT = '.zip'
+    ARCHIVE_COMPRESS_LEVEL = 1  # Fastest deflate, INI and JSON files still shrink several times
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, src_dir, dest_dir, archive: bool = False):
         self._src_dir = src_dir
         self._dest_dir = dest_dir
+        self._archive = archive  # New backups go into one zip per version instead of a folder of copies
+        self._stored: dict = {}  # Content hash -> backup file holding it, used to hardlink identical files
 
     @property
     def src_dir(self):
@@ -16,42 +27,261 @@ class Backup:
     def dest_dir(self):
         return self._dest_dir
 
-    def backup_version(self, version_folder_name: str):
+    def backup_version(self, version_folder_name: str, file_manifest: FileManifest) -> int:
+        # Backs up the files listed in file_manifest, returns the number of files in the backup
         # Backup folder does not exist yet
         if not os.path.exists(self._dest_dir):
             os.makedirs(self._dest_dir)
             logging.info(f"Created backup folder in: {self._dest_dir}")
         else:
             logging.info(f"Backup folder already exists in: {self._dest_dir}")
+        if not self._stored and not self._archive:
+            self.load_stored_files()
+        version_backup_folder = os.path.join(self._dest_dir, version_folder_name)
+        manifest = self.load_manifest(version_folder_name)
+        if manifest is None and os.path.exists(version_backup_folder):  # Backup taken before manifests existed
+            manifest = self.create_manifest_from_backup(version_folder_name)
+            self.save_manifest(version_folder_name, manifest)
+        if manifest is not None and not manifest['restored']:
+            # Files were not restored since this backup, the live files may still hold default values
+            logging.warning(f"Backup of {version_folder_name} was not restored yet, keeping the existing backup")
+            return len(manifest['files'])
+        if self._archive:
+            return self.backup_version_archive(version_folder_name, file_manifest)
+        # Files of an archive backup are not in the folder
+        old_files: dict = manifest['files'] if manifest is not None and not manifest.get('archive') else {}
+        new_files = {}
+        copied = 0
+        for src_file, rel_path, extension, size, mtime_ns in file_manifest.get_files():
+            dst_file = os.path.join(version_backup_folder, rel_path)
+            try:
+                entry = old_files.get(rel_path)
+                if size is None:  # Not known from the listing
+                    stat = os.stat(src_file)
+                    size, mtime_ns = stat.st_size, stat.st_mtime_ns
+                if entry is not None and Backup.is_same_stat(entry, size, mtime_ns) and os.path.exists(dst_file):
+                    new_files[rel_path] = entry  # Untouched since the last backup
+                    continue
+                digest = Backup.hash_file(src_file)
+                if entry is None or entry['sha256'] != digest or not os.path.exists(dst_file):
+                    self.store_file(src_file, dst_file, digest, entry)
+                    copied += 1
+                new_files[rel_path] = Backup.create_entry(size, mtime_ns, digest)
+            except Exception as err:
+                logging.warning(f"Failed to backup: {src_file}, error: {err} type: {type(err)}")
+        for rel_path in old_files.keys() - new_files.keys():  # Files that no longer exist in the version
+            self.remove_file(os.path.join(version_backup_folder, rel_path), old_files[rel_path])
+        self.save_manifest(version_folder_name, {'restored': False, 'files': new_files})
+        self.remove_file(self.get_archive_path(version_folder_name), None)  # Archive of an earlier run, if any
+        logging.info(f"Backup completed for: {version_folder_name}, {copied} of {len(new_files)} files were copied")
+        return len(new_files)
+
+    def backup_version_archive(self, version_folder_name: str, file_manifest: FileManifest) -> int:
+        # Streams the files into one zip, each file is read once for both the archive and its hash
+        archive_path = self.get_archive_path(version_folder_name)
+        new_files = {}
+        with zipfile.ZipFile(archive_path + '.tmp', 'w', zipfile.ZIP_DEFLATED,
+                             compresslevel=Backup.ARCHIVE_COMPRESS_LEVEL) as archive:
+            for src_file, rel_path, extension, size, mtime_ns in file_manifest.get_files():
+                try:
+                    with open(src_file, 'rb') as file:
+                        content = file.read()
+                        stat = os.fstat(file.fileno())  # Stat of the content that is backed up
+                    archive.writestr(Backup.get_member_name(rel_path), content)
+                    new_files[rel_path] = Backup.create_entry(stat.st_size, stat.st_mtime_ns,
+                                                              hashlib.sha256(content).hexdigest())
+                except Exception as err:
+                    logging.warning(f"Failed to backup: {src_file}, error: {err} type: {type(err)}")
+        os.replace(archive_path + '.tmp', archive_path)
+        self.save_manifest(version_folder_name, {'restored': False, 'archive': True, 'files': new_files})
+        # Copies of an earlier folder backup, other versions keep their hardlinks to the same content
+        shutil.rmtree(os.path.join(self._dest_dir, version_folder_name), ignore_errors=True)
+        logging.info(f"Backup completed for: {version_folder_name}, {len(new_files)} files in: {archive_path}")
+        return len(new_files)
+
+    def restore(self, version_folder_name: str) -> int:  # Returns the number of files copied back
+        manifest = self.load_manifest(version_folder_name)
+        if manifest is None:  # Backup taken before manifests existed
+            return self.restore_all(version_folder_name)
+        if manifest.get('archive'):
+            return self.restore_archive(version_folder_name, manifest)
         version_folder_path = os.path.join(self._src_dir, version_folder_name)
         version_backup_folder = os.path.join(self._dest_dir, version_folder_name)
-        # Version folder does not already exist in backup folder
-        if not os.path.exists(version_backup_folder):
-            os.makedirs(os.path.join(self._dest_dir, version_folder_name))
-            ext_ini = '.ini'
-            ext_json = '.json'
-            for root, dirs, files in os.walk(os.path.join(self._src_dir, version_folder_path)):
-                for dir in dirs:
-                    dest_subdir = os.path.join(version_backup_folder, os.path.relpath(root, version_folder_path), dir)
-                    os.makedirs(dest_subdir, exist_ok=True)
-                for filename in files:
-                    if filename.endswith(ext_ini) or filename.endswith(ext_json):
-                        src_file = os.path.join(root, filename)
-                        dst_file = os.path.join(version_backup_folder, os.path.relpath(src_file, version_folder_path))
-                        try:
-                            shutil.copy2(src_file, dst_file)
-                        except Exception as err:
-                            logging.warning(f"Failed to backup: {src_file}, error: {err} type: {type(err)}")
-            logging.info(f"Backup completed for: {version_folder_name}")
-        else:
-            logging.info(f"Backup folder of {version_folder_name} already exists")
+        restored = 0
+        for rel_path, entry in manifest['files'].items():
+            dst_file = os.path.join(version_folder_path, rel_path)
+            src_file = os.path.join(version_backup_folder, rel_path)
+            try:
+                live_entry = Backup.get_live_entry(dst_file, entry)
+                if live_entry is not None:
+                    manifest['files'][rel_path] = live_entry
+                    continue
+                shutil.copy(src_file, dst_file)
+                stat = os.stat(dst_file)
+                manifest['files'][rel_path] = Backup.create_entry(stat.st_size, stat.st_mtime_ns, entry['sha256'])
+                restored += 1
+            except Exception as err:
+                logging.warning(f"Failed to restore {src_file}, err: {err}, type: {type(err)}")
+        manifest['restored'] = True
+        self.save_manifest(version_folder_name, manifest)
+        logging.info(f"Restore completed for: {version_folder_name}, {restored} files were restored")
+        return restored
 
-    def restore(self, version_folder_name: str):
+    def restore_archive(self, version_folder_name: str, manifest: dict) -> int:
+        # Extracts only the files that differ from the live files, in the order they are in the archive
+        version_folder_path = os.path.join(self._src_dir, version_folder_name)
+        archive_path = self.get_archive_path(version_folder_name)
+        restored = 0
+        try:
+            archive = zipfile.ZipFile(archive_path)
+        except Exception as err:  # Not marked as restored, the next backup keeps this backup
+            logging.error(f"Failed to open backup archive: {archive_path}, err: {err}, type: {type(err)}")
+            return restored
+        with archive:
+            for rel_path, entry in manifest['files'].items():
+                dst_file = os.path.join(version_folder_path, rel_path)
+                try:
+                    live_entry = Backup.get_live_entry(dst_file, entry)
+                    if live_entry is not None:
+                        manifest['files'][rel_path] = live_entry
+                        continue
+                    with archive.open(Backup.get_member_name(rel_path)) as src, open(dst_file, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    stat = os.stat(dst_file)
+                    manifest['files'][rel_path] = Backup.create_entry(stat.st_size, stat.st_mtime_ns,
+                                                                      entry['sha256'])
+                    restored += 1
+                except Exception as err:
+                    logging.warning(f"Failed to restore {rel_path} from {archive_path}, err: {err}, "
+                                    f"type: {type(err)}")
+        manifest['restored'] = True
+        self.save_manifest(version_folder_name, manifest)
+        logging.info(f"Restore completed for: {version_folder_name}, {restored} files were restored")
+        return restored
+
+    @staticmethod
+    def get_live_entry(live_file: str, entry: dict):
+        # Entry with the stat of the live file when it holds the backed up content, otherwise None
+        if not os.path.exists(live_file):
+            return None
+        stat = os.stat(live_file)
+        if Backup.is_same_stat(entry, stat.st_size, stat.st_mtime_ns):
+            return entry
+        if Backup.hash_file(live_file) == entry['sha256']:
+            return Backup.create_entry(stat.st_size, stat.st_mtime_ns, entry['sha256'])
+        return None
+
+    def restore_all(self, version_folder_name: str) -> int:
+        restored = 0
         for root, dirs, files in os.walk(os.path.join(self._dest_dir, version_folder_name), topdown=False):
             for file in files:
                 dst_rel = os.path.join(self._src_dir, os.path.relpath(root, self._dest_dir), file)
                 src_rel = os.path.join(self._dest_dir, os.path.relpath(root, self._dest_dir), file)
                 try:
                     shutil.copy(src_rel, dst_rel)
+                    restored += 1
                 except Exception as err:
                     logging.warning(f"Failed to restore {src_rel}, err: {err}, type: {type(err)}")
+        return restored
+
+    def read_backup(self, version_folder_name: str):  # (rel_path, content) of every backed up file of a version
+        manifest = self.load_manifest(version_folder_name)
+        if manifest is not None and manifest.get('archive'):
+            with zipfile.ZipFile(self.get_archive_path(version_folder_name)) as archive:
+                for member in archive.infolist():
+                    yield member.filename.replace('/', os.sep), archive.read(member)
+            return
+        version_backup_folder = os.path.join(self._dest_dir, version_folder_name)
+        for root, dirs, files in os.walk(version_backup_folder):
+            for filename in files:
+                backup_file = os.path.join(root, filename)
+                with open(backup_file, 'rb') as file:
+                    yield os.path.relpath(backup_file, version_backup_folder), file.read()
+
+    def store_file(self, src_file: str, dst_file: str, digest: str, old_entry: dict):
+        # Never write into an existing backup file, it may be a hardlink shared with another backup
+        if os.path.exists(dst_file):
+            self.remove_file(dst_file, old_entry)
+        os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+        stored_file = self._stored.get(digest)
+        try:
+            if stored_file is None:
+                raise FileNotFoundError(digest)
+            os.link(stored_file, dst_file)
+        except OSError:  # No file with this content yet or the file system has no hardlinks
+            shutil.copy2(src_file, dst_file)
+        self._stored[digest] = dst_file
+
+    def remove_file(self, backup_file: str, entry: dict):
+        if entry is not None and self._stored.get(entry['sha256']) == backup_file:
+            del self._stored[entry['sha256']]
+        try:
+            os.remove(backup_file)
+        except FileNotFoundError:
+            pass
+
+    def load_stored_files(self):
+        for name in os.listdir(self._dest_dir):
+            if name.endswith(Backup.MANIFEST_SUFFIX):
+                version_folder_name = name[:-len(Backup.MANIFEST_SUFFIX)]
+                manifest = self.load_manifest(version_folder_name)
+                if manifest is None or manifest.get('archive'):  # No backup files to link to
+                    continue
+                for rel_path, entry in manifest.get('files', {}).items():
+                    self._stored.setdefault(entry['sha256'],
+                                            os.path.join(self._dest_dir, version_folder_name, rel_path))
+
+    def create_manifest_from_backup(self, version_folder_name: str) -> dict:
+        version_backup_folder = os.path.join(self._dest_dir, version_folder_name)
+        files = {}
+        for root, dirs, filenames in os.walk(version_backup_folder):
+            for filename in filenames:
+                backup_file = os.path.join(root, filename)
+                # No live stat is known, restore compares the live files by content
+                files[os.path.relpath(backup_file, version_backup_folder)] = {'size': None, 'mtime_ns': None,
+                                                                              'sha256': Backup.hash_file(backup_file)}
+        logging.info(f"Created manifest for existing backup of: {version_folder_name}")
+        return {'restored': False, 'files': files}
+
+    def get_archive_path(self, version_folder_name: str) -> str:
+        return os.path.join(self._dest_dir, version_folder_name + Backup.ARCHIVE_EXT)
+
+    @staticmethod
+    def get_member_name(rel_path: str) -> str:  # Zip entries are separated by / on every OS
+        return rel_path.replace(os.sep, '/')
+
+    def get_manifest_path(self, version_folder_name: str) -> str:
+        return os.path.join(self._dest_dir, version_folder_name + Backup.MANIFEST_SUFFIX)
+
+    def load_manifest(self, version_folder_name: str):
+        manifest_path = self.get_manifest_path(version_folder_name)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r') as file:
+                return json.load(file)
+        except Exception as err:
+            logging.warning(f"Failed to read backup manifest: {manifest_path}, err: {err}, type: {type(err)}")
+            return None
+
+    def save_manifest(self, version_folder_name: str, manifest: dict):
+        manifest_path = self.get_manifest_path(version_folder_name)
+        with open(manifest_path + '.tmp', 'w') as file:
+            json.dump(manifest, file)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    @staticmethod
+    def create_entry(size: int, mtime_ns: int, digest: str) -> dict:
+        return {'size': size, 'mtime_ns': mtime_ns, 'sha256': digest}
+
+    @staticmethod
+    def is_same_stat(entry: dict, size: int, mtime_ns: int) -> bool:
+        return entry['size'] == size and entry['mtime_ns'] == mtime_ns
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(Backup.HASH_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
@@ -0,0 +1,229 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import random
+import shutil
+import sys
+import time
+import main
+from RunProfiler import RunProfiler
+
+VENDOR = 'BenchVendor'
+MR_MODEL = 'BenchMR'
+FIELD_STRENGTH = '3T'
+COMMON_VERSION = 'CommonMR'
+MARKER_FILE = '.xpert_benchmark'
+STAGES = ['read_inputs', 'filter_req', 'parse_req', 'scan', 'backup', 'set_default_values', 'validate', 'output',
+          'restore']
+
+
+def define_inputs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate a synthetic FusWs tree and time every XPERT stage on it")
+    parser.add_argument("-w", "--work_dir", required=True,
+                        help="Folder for the generated FusWs tree, req.csv, filesToSkip.json and the run outputs")
+    parser.add_argument("--versions", type=int, default=3, help="Number of FUS versions besides CommonMR")
+    parser.add_argument("--files", type=int, default=100, help="Number of INI/JSON files per version")
+    parser.add_argument("--sections", type=int, default=10, help="Number of sections per file")
+    parser.add_argument("--keys", type=int, default=20, help="Number of keys per section")
+    parser.add_argument("--json_ratio", type=float, default=0.2, help="Part of the files that are JSON")
+    parser.add_argument("--req_ratio", type=float, default=0.3, help="Part of the keys that have a requirement")
+    parser.add_argument("--skip_ratio", type=float, default=0.1, help="Part of the INI files in filesToSkip.json")
+    parser.add_argument("--xcom_ratio", type=float, default=0.5,
+                        help="Part of the files XCom is simulated on by writing back their original values")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated values")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs, the fastest time of a stage is kept")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="--jobs passed to XPERT")
+    parser.add_argument("--backup_archive", action="store_true", help="--backup_archive passed to XPERT")
+    parser.add_argument("--read_threads", type=int, default=0, help="--read_threads passed to XPERT")
+    parser.add_argument("--log_level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="DEBUG",
+                        help="--log_level passed to XPERT")
+    parser.add_argument("-o", "--report", required=False, help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", required=False, help="JSON report of an earlier run to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown of a stage compared to the baseline, 0.2 is 20%%")
+    return parser.parse_args()
+
+
+def prepare_work_dir(work_dir: str) -> None:  # Never clean a folder that was not created by the benchmark
+    if os.path.exists(work_dir) and os.listdir(work_dir) and not os.path.exists(os.path.join(work_dir, MARKER_FILE)):
+        raise Exception(f"{work_dir} is not empty and was not created by the benchmark")
+    for folder in ('FusWs', 'Backup', 'Results', 'Cache'):
+        shutil.rmtree(os.path.join(work_dir, folder), ignore_errors=True)
+    os.makedirs(work_dir, exist_ok=True)
+    open(os.path.join(work_dir, MARKER_FILE), 'w').close()
+
+
+def generate_value(rnd: random.Random):
+    return rnd.choice([rnd.randint(-100, 1000), round(rnd.uniform(0, 100), 2), rnd.choice(['on', 'off', 'abc']),
+                       rnd.choice([True, False])])
+
+
+def generate_tree(arguments: argparse.Namespace) -> dict:
+    # FusWs\Fus-<i>_<build> folders like the ones XCom works on, plus a matching req.csv and filesToSkip.json
+    rnd = random.Random(arguments.seed)
+    root = os.path.join(arguments.work_dir, 'FusWs')
+    os.makedirs(os.path.join(root, COMMON_VERSION, 'Common'))
+    with open(os.path.join(root, COMMON_VERSION, 'Common', 'common.ini'), 'w') as file:
+        file.write("[Common]\nKey = 1\n")
+    versions = [f"Fus-{i}" for i in range(1, arguments.versions + 1)]
+    req_rows = []
+    files_to_skip = {}
+    json_files = int(arguments.files * arguments.json_ratio)
+    for version in versions:
+        version_folder = os.path.join(root, f"{version}_{rnd.randint(1000, 9999)}")
+        for i in range(arguments.files):
+            is_json = i < json_files
+            rel_path = os.path.join('Site', f"SiteInifiles{i % 10}", f"file{i}.json" if is_json else f"file{i}.ini")
+            os.makedirs(os.path.dirname(os.path.join(version_folder, rel_path)), exist_ok=True)
+            data = {f"Section{s}": {f"Key{k}": generate_value(rnd) for k in range(arguments.keys)}
+                    for s in range(arguments.sections)}
+            with open(os.path.join(version_folder, rel_path), 'w') as file:
+                if is_json:
+                    json.dump(data, file, indent=4)
+                else:
+                    for section, keys in data.items():
+                        file.write(f"[{section}]\n")
+                        file.writelines(f"{key} = {value}\n" for key, value in keys.items())
+            for section, keys in data.items():
+                for key, value in keys.items():
+                    if rnd.random() < arguments.req_ratio:
+                        expected = value if rnd.random() < 0.8 else generate_value(rnd)
+                        req_rows.append([VENDOR, MR_MODEL, FIELD_STRENGTH, os.path.join(version, rel_path), section,
+                                         key, str(expected), version])
+            if not is_json and rnd.random() < arguments.skip_ratio:
+                files_to_skip[rel_path] = {'Section0': [f"Key{k}" for k in range(0, arguments.keys, 2)]}
+    req_path = os.path.join(arguments.work_dir, 'req.csv')
+    with open(req_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Vendor', 'MR', 'FieldStrength', 'path', 'section', 'ini key', 'value',
+                         'added/updated in Xcom Version'])
+        writer.writerows(req_rows)
+    files_to_skip_path = os.path.join(arguments.work_dir, 'filesToSkip.json')
+    with open(files_to_skip_path, 'w') as file:
+        json.dump(files_to_skip, file, indent=4)
+    return {'root': root, 'versions': versions, 'req_path': req_path, 'files_to_skip_path': files_to_skip_path,
+            'files': len(versions) * arguments.files,
+            'keys': len(versions) * arguments.files * arguments.sections * arguments.keys,
+            'req_rows': len(req_rows)}
+
+
+def run_stages(arguments: argparse.Namespace, tree: dict) -> dict:  # One XPERT run without the XCom prompt
+    timings = {}
+
+    def run_stage(name: str, func) -> None:
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # Hide the progress prints
+            func()
+        timings[name] = time.perf_counter() - start
+
+    def read_inputs() -> None:
+        (main.skip_index, main.vendor, main.mr_model, main.field_strength, main.ls_fus_versions,
+         main.backup_option) = main.read_inputs(main.args)
+        main.df_req, main.req_index = None, None
+        main.get_req()
+
+    def filter_req() -> None:
+        main.df_filtered = main.filter_req(main.get_req())
+
+    def parse_req() -> None:
+        main.requirements = main.parse_req()
+
+    def scan() -> None:
+        main.mapping = main.map_versions(main.ls_fus_versions)
+        main.rename_versions(main.ls_fus_versions)
+        main.manifests = main.scan_versions(main.ls_fus_versions)
+
+    def backup() -> None:
+        main.backup_details = main.backup_versions()
+
+    def simulate_xcom() -> None:  # Not timed, stands for the operator running XCom
+        rnd = random.Random(arguments.seed)
+        for version in main.ls_fus_versions:
+            for rel_path, content in main.backup_details.read_backup(version):
+                if rnd.random() < arguments.xcom_ratio:
+                    with open(os.path.join(tree['root'], version, rel_path), 'wb') as file:
+                        file.write(content)
+
+    def restore() -> None:
+        main.restore_versions(main.backup_details)
+        main.restore_folder_names(main.mapping, main.args.root)
+
+    main.args = main.define_inputs(['-i', tree['req_path'], '-n', tree['files_to_skip_path'], '-v', VENDOR,
+                                    '-m', MR_MODEL, '-f', FIELD_STRENGTH, '--versions', COMMON_VERSION,
+                                    *tree['versions'], '-r', tree['root'], '-w', arguments.work_dir,
+                                    '-j', str(arguments.jobs), '--read_threads', str(arguments.read_threads),
+                                    '--log_level', arguments.log_level, '--no_req_cache',
+                                    *(['--backup_archive'] if arguments.backup_archive else [])])
+    main.profiler = RunProfiler()  # Stages are timed by the benchmark itself
+    run_stage('read_inputs', read_inputs)
+    run_stage('filter_req', filter_req)
+    run_stage('parse_req', parse_req)
+    run_stage('scan', scan)
+    run_stage('backup', backup)
+    run_stage('set_default_values', lambda: main.set_default_values(main.ls_fus_versions))
+    simulate_xcom()
+    run_stage('validate', lambda: main.validate_versions(main.ls_fus_versions))
+    run_stage('output', lambda: main.create_output(main.requirements, main.ls_fus_versions))
+    run_stage('restore', restore)
+    return timings
+
+
+def create_report(arguments: argparse.Namespace, tree: dict, runs: list) -> dict:
+    stages = {}
+    for stage in STAGES:
+        seconds = min(timings[stage] for timings in runs)
+        stages[stage] = {'seconds': round(seconds, 4),
+                         'files_per_s': round(tree['files'] / seconds, 1) if seconds else None,
+                         'keys_per_s': round(tree['keys'] / seconds, 1) if seconds else None}
+    parameters = {name: getattr(arguments, name) for name in ('versions', 'files', 'sections', 'keys', 'json_ratio',
+                                                               'req_ratio', 'skip_ratio', 'xcom_ratio', 'seed',
+                                                               'repeat', 'jobs', 'read_threads', 'backup_archive',
+                                                               'log_level')}
+    return {'parameters': parameters, 'files': tree['files'], 'keys': tree['keys'], 'req_rows': tree['req_rows'],
+            'total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 4), 'stages': stages}
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['files']} files, {report['keys']} keys, {report['req_rows']} requirement rows")
+    print(f"{'Stage':<20}{'Seconds':>10}{'Files/s':>14}{'Keys/s':>14}")
+    for stage, result in report['stages'].items():
+        print(f"{stage:<20}{result['seconds']:>10.3f}{result['files_per_s'] or 0:>14.1f}"
+              f"{result['keys_per_s'] or 0:>14.1f}")
+    print(f"{'total':<20}{report['total_seconds']:>10.3f}")
+
+
+def compare_to_baseline(report: dict, baseline_path: str, tolerance: float) -> list:
+    # Stages that got slower than the baseline by more than the tolerance
+    with open(baseline_path, 'r') as file:
+        baseline = json.load(file)
+    if baseline['parameters'] != report['parameters']:
+        print(f"Warning: baseline parameters differ: {baseline['parameters']}")
+    regressions = []
+    for stage, result in report['stages'].items():
+        baseline_seconds = baseline['stages'].get(stage, {}).get('seconds')
+        if baseline_seconds is not None and result['seconds'] > baseline_seconds * (1 + tolerance) \
+                and result['seconds'] - baseline_seconds > 0.05:  # Ignore noise of very short stages
+            regressions.append(stage)
+            print(f"Regression in {stage}: {result['seconds']:.3f}s, baseline {baseline_seconds:.3f}s")
+    return regressions
+
+
+if __name__ == "__main__":
+    args = define_inputs()
+    prepare_work_dir(args.work_dir)
+    print("Generating FusWs tree")
+    generated_tree = generate_tree(args)
+    main.log_config = main.define_log(args.work_dir, args.log_level)
+    all_runs = []
+    for run in range(args.repeat):
+        print(f"Run {run + 1} of {args.repeat}")
+        all_runs.append(run_stages(args, generated_tree))
+    run_report = create_report(args, generated_tree, all_runs)
+    print_report(run_report)
+    if args.report is not None:
+        with open(args.report, 'w') as report_file:
+            json.dump(run_report, report_file, indent=4)
+    if args.baseline is not None and compare_to_baseline(run_report, args.baseline, args.tolerance):
+        sys.exit(1)
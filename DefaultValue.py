@@ -1,6 +1,11 @@
+import io
+import json
 import logging
-import os
-import json5 as json
+import re
+from concurrent.futures import ThreadPoolExecutor
+import json5
+from FileManifest import FileManifest
+from SkipIndex import SkipIndex
 
 
 class DefaultValue:
@@ -8,105 +13,166 @@ class DefaultValue:
     DEFAULT_VALUE_JSON = 12345
 
     @staticmethod
-    def set_default_values_in_folder(folder_path: str, files_to_skip: dict):
-        for root, dirs, files in os.walk(folder_path, topdown=False):
-            for filename in files:
-                file_path = os.path.join(root, filename)
-                path_no_prefix = os.sep.join(file_path.split(os.sep)[3:])
-                sections_to_skip = files_to_skip.get(path_no_prefix)
-                extension = os.path.splitext(filename)[1]
-                match extension:
-                    case '.ini':
-                        if sections_to_skip is None:  # There are no skipped keys in file
-                            try:
-                                DefaultValueIni.set_default_values_ini(file_path)
-                            except Exception as err:
-                                logging.warning(f"Failed to set default values to: {file_path}, error: {err}, type: {type(err)}")
-                        else:
-                            try:
-                                DefaultValueIni.set_default_values_ini_skipped_keys(file_path, sections_to_skip)
-                            except Exception as err:
-                                logging.warning(f"Failed to set default values to: {file_path}, error: {err}, type: {type(err)}")
-                    case '.json':
-                        try:
-                            DefaultValueJson.set_default_values_json(file_path)
-                        except Exception as err:
-                            logging.warning(
-                                f"Failed to set default values to: {file_path}, error: {err}, type: {type(err)}")
+    def set_default_values_in_folder(manifest: FileManifest, skip_index: SkipIndex, jobs: int = 1) -> tuple:
+        # Returns the number of files and the number of them that were written
+        files = DefaultValue.list_files(manifest, skip_index)
+        if jobs > 1:  # Files are independent, rewrite them concurrently with a bounded number of threads
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                written = list(executor.map(lambda file: DefaultValue.set_default_values_file(*file), files))
+        else:
+            written = [DefaultValue.set_default_values_file(*file) for file in files]
+        logging.info(f"Default values were written to {written.count(True)} of {len(files)} files, "
+                     f"the others already have them")
+        return len(files), written.count(True)
+
+    @staticmethod
+    def list_files(manifest: FileManifest, skip_index: SkipIndex) -> list:
+        files_to_set = []
+        for file_path, path_no_prefix, extension, size, mtime_ns in manifest.get_files():  # Without D:\FusWs\Fus-7.44
+            if extension == '.ini' or extension == '.json':
+                files_to_set.append((file_path, extension, skip_index.get_prefixes(path_no_prefix)))
+        return files_to_set
+
+    @staticmethod
+    def set_default_values_file(file_path: str, extension: str, sections_to_skip: dict) -> bool:
+        # Returns whether the file was written
+        match extension:
+            case '.ini':
+                if sections_to_skip is None:  # There are no skipped keys in file
+                    try:
+                        return DefaultValueIni.set_default_values_ini(file_path)
+                    except Exception as err:
+                        logging.warning(f"Failed to set default values to: {file_path}, error: {err}, type: {type(err)}")
+                else:
+                    try:
+                        return DefaultValueIni.set_default_values_ini_skipped_keys(file_path, sections_to_skip)
+                    except Exception as err:
+                        logging.warning(f"Failed to set default values to: {file_path}, error: {err}, type: {type(err)}")
+            case '.json':
+                try:
+                    return DefaultValueJson.set_default_values_json(file_path)
+                except Exception as err:
+                    logging.warning(
+                        f"Failed to set default values to: {file_path}, error: {err}, type: {type(err)}")
+        return False
+
+    @staticmethod
+    def read_file(file_path: str) -> tuple:  # The bytes of the file and the text open(file_path, 'r') reads
+        with open(file_path, 'rb') as file:
+            data = file.read()
+        return data, io.TextIOWrapper(io.BytesIO(data)).read()
+
+    @staticmethod
+    def write_file(file_path: str, data: bytes, new_content: str) -> bool:
+        # Writes the bytes open(file_path, 'w') writes for new_content, unless the file already has them. A file that
+        # is not written keeps its mtime, backup, restore and --watch find nothing to do in it
+        new_data = io.BytesIO()
+        writer = io.TextIOWrapper(new_data)  # Same encoding and line endings as text mode
+        writer.write(new_content)
+        writer.flush()
+        if new_data.getvalue() == data:
+            return False
+        with open(file_path, 'wb') as file:
+            file.write(new_data.getvalue())
+        return True
 
 
 class DefaultValueIni:
+    # Rewrites the whole file with these patterns instead of line by line. Lines are the lines of str.splitlines, its
+    # other line breaks are replaced by '\n' first
+    LINE_BREAKS = re.compile('[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+    SECTION_LINES = re.compile(r'^\[.*\n', re.M)
+    # Lines with '=' that are not 'key = null' yet. The key keeps its spaces, a line that was set is kept as is, else
+    # 'key = 1' would get one more space before '=' in every run and the file would never be the same
+    KEY_LINES = re.compile(r'^(?![^=\n]* = null$)([^=\n]*)=.*$', re.M)
+    # Comments and lines without '=', sections are kept
+    DROPPED_LINES = re.compile(r'^(?:;.*|(?!\[)[^=\n]*)\n', re.M)
+    # With skipped keys: lines with ';' anywhere and lines without '=', sections are matched by SECTION_LINES first
+    DROPPED_LINES_SKIPPED_KEYS = re.compile(r'^(?:.*;.*|[^=\n]*)\n', re.M)
+    DEFAULT_LINE = r'\1 = ' + DefaultValue.DEFAULT_VALUE_INI
+
     @staticmethod
-    def set_default_values_ini_skipped_keys(file_path: str, skipped_sections: dict):
+    def set_default_values_ini_skipped_keys(file_path: str, skipped_sections: dict) -> bool:
         try:
-            with open(file_path, 'r') as file:
-                content = file.read()
+            data, content = DefaultValue.read_file(file_path)
         except Exception as err:
             logging.warning(f"Could not read file: {file_path}, err: {err}, type: {type(err)}")
-        new_lines = []
-        in_keep_section = False
-        for line in content.splitlines():
-            if line.startswith("["):
-                section_name = line.strip()[1:-1]
-                in_keep_section = section_name in skipped_sections
-                new_lines.append(line)
-            elif in_keep_section:  # Line is a skipped section
-                if line.startswith(tuple(skipped_sections[section_name])):  # Check if line starts with a kept key
-                    new_lines.append(line)
-                else:  # Line does not start with a skipped key
-                    if not line.startswith(';') and ';' not in line and '=' in line:  # Line is not a comment
-                        key, value = line.split('=', 1)
-                        new_lines.append(f"{key} = " + DefaultValue.DEFAULT_VALUE_INI)
-            else:  # Line is not a skipped section
-                if not line.startswith(';') and ';' not in line and '=' in line:
-                    key, value = line.split('=', 1)
-                    # Set all values to default values outside a skipped  sections
-                    new_lines.append(f"{key} = " + DefaultValue.DEFAULT_VALUE_INI)
-        new_content = "\n".join(new_lines)
+        content = DefaultValueIni.get_lines(content)
+        new_content = []
+        start = 0
+        section_name = None
+        for section_line in DefaultValueIni.SECTION_LINES.finditer(content):
+            new_content.append(DefaultValueIni.set_default_lines(content[start:section_line.start()], skipped_sections,
+                                                                 section_name))
+            new_content.append(section_line.group())
+            section_name = section_line.group()[:-1].strip()[1:-1]
+            start = section_line.end()
+        new_content.append(DefaultValueIni.set_default_lines(content[start:], skipped_sections, section_name))
+        new_content = "".join(new_content)[:-1]  # Without the '\n' of the last line
         try:
-            with open(file_path, 'w') as file:
-                file.write(new_content)
+            return DefaultValue.write_file(file_path, data, new_content)
         except Exception as err:
-            logging.warning(f"Could not read file: {file_path}, err: {err}, type: {type(err)}")
+            logging.warning(f"Could not write to file: {file_path}, err: {err}, type: {type(err)}")
+        return False
+
+    @staticmethod
+    def set_default_lines(lines: str, skipped_sections: dict, section_name) -> str:
+        # Lines of one section, section_name is None before the first section
+        if section_name is None or section_name not in skipped_sections:
+            # Set all values to default values outside a skipped  sections
+            return DefaultValueIni.KEY_LINES.sub(DefaultValueIni.DEFAULT_LINE,
+                                                 DefaultValueIni.DROPPED_LINES_SKIPPED_KEYS.sub('', lines))
+        new_lines = []
+        for line in lines.split('\n')[:-1]:  # Line is a skipped section
+            if line.startswith(skipped_sections[section_name]):  # Check if line starts with a kept key
+                new_lines.append(line + '\n')
+            elif ';' not in line and '=' in line:  # Line is not a comment
+                new_lines.append(DefaultValueIni.KEY_LINES.sub(DefaultValueIni.DEFAULT_LINE, line) + '\n')
+        return "".join(new_lines)
 
     @staticmethod
-    def set_default_values_ini(file_path: str):
+    def set_default_values_ini(file_path: str) -> bool:
         try:
-            with open(file_path, "r") as f:
-                content = f.read()
+            data, content = DefaultValue.read_file(file_path)
         except Exception as err:
             logging.warning(f"Could not read file: {file_path}, err: {err}, type: {type(err)}")
-        lines = []
-        for line in content.splitlines():
-            if (";" not in line or not line.startswith(';')) and "=" in line:
-                key, value = line.split('=', 1)
-                lines.append(f"{key} = " + DefaultValue.DEFAULT_VALUE_INI)
-            elif line.startswith('['):
-                lines.append(line)
-        new_content = "\n".join(lines)
+        content = DefaultValueIni.get_lines(content)
+        new_content = DefaultValueIni.KEY_LINES.sub(DefaultValueIni.DEFAULT_LINE,
+                                                    DefaultValueIni.DROPPED_LINES.sub('', content))[:-1]
         try:
-            with open(file_path, 'w') as f:
-                f.write(new_content)
+            return DefaultValue.write_file(file_path, data, new_content)
         except Exception as err:
             logging.warning(f"Could not write to file: {file_path}, err: {err}, type: {type(err)}")
+        return False
+
+    @staticmethod
+    def get_lines(content: str) -> str:  # The lines of content.splitlines(), each ends with '\n'
+        if DefaultValueIni.LINE_BREAKS.search(content) is not None:
+            lines = content.splitlines()
+            return "\n".join(lines) + "\n" if lines else ""
+        if content and not content.endswith('\n'):
+            return content + '\n'
+        return content
 
 
 class DefaultValueJson:
     @staticmethod
-    def set_default_values_json(file_path: str):
+    def set_default_values_json(file_path: str) -> bool:
         try:
-            with open(file_path, 'r') as file_to_read:
-                file_data = file_to_read.read()
+            data, file_data = DefaultValue.read_file(file_path)
         except Exception as err:
             logging.info(f"Could not read file: {file_path}, error: {err}, type: {type(err)}")
         if file_data[0] == '{':
-            json_data = json.loads(file_data)
+            try:  # Only the keys are kept, plain JSON has the same keys with the much faster json module
+                json_data = json.loads(file_data)
+            except ValueError:
+                json_data = json5.loads(file_data)
             DefaultValueJson.set_dict_to_zeros(json_data)
             try:
-                with open(file_path, 'w') as file_to_write:
-                    json.dump(json_data, file_to_write, indent=4)
+                return DefaultValue.write_file(file_path, data, json5.dumps(json_data, indent=4))
             except Exception as err:
                 logging.info(f"Could not write to file: {file_path}, error: {err}, type: {type(err)}")
+        return False
 
     @staticmethod
     def set_dict_to_zeros(dictionary: dict):
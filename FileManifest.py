@@ -0,0 +1,121 @@
+import os
+import time
+
+
+class FileManifest:
+    # INI/JSON files of a version folder, listed once with os.scandir and shared by backup, default values and
+    # validation. Files are in the order of os.walk(topdown=False), the order the stages always used
+    EXTENSIONS = ('.ini', '.json')
+    RACY_NS = 2 * 10 ** 9  # A folder changed this close to its listing may change again with the same mtime (FAT)
+
+    def __init__(self, version_path: str):
+        self._version_path = version_path
+        self._prefix_length = len(version_path) + len(os.sep)
+        # Folder -> (mtime_ns, listing time ns, sub folders, files), parents before their sub folders
+        self._dirs: dict = {}
+
+    @property
+    def version_path(self):
+        return self._version_path
+
+    def scan(self) -> int:  # Returns the number of files
+        self._dirs = {}
+        try:
+            self.scan_dir(self._version_path, os.stat(self._version_path).st_mtime_ns)
+        except OSError:  # Like os.walk, a missing folder has no files
+            pass
+        return len(self.get_files())
+
+    def refresh(self) -> int:
+        # Lists again only the folders whose mtime changed, adding or removing a file changes the mtime of its folder.
+        # Files of the other folders are only stat again, editing a file does not change the mtime of its folder
+        relisted = 0
+        for dir_path in list(self._dirs):
+            if dir_path not in self._dirs:  # Removed with its parent folder
+                continue
+            mtime_ns, listed_ns, subdirs, files = self._dirs[dir_path]
+            try:
+                current_mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                current_mtime_ns = None
+            if mtime_ns is None or current_mtime_ns != mtime_ns or mtime_ns >= listed_ns - FileManifest.RACY_NS:
+                self.rescan_dir(dir_path, current_mtime_ns)
+                relisted += 1
+            else:
+                self._dirs[dir_path] = (mtime_ns, listed_ns, subdirs, [FileManifest.stat_file(file) for file in files])
+        return relisted
+
+    def get_files(self) -> list:  # [(path, path relative to the version folder, extension, size, mtime_ns)]
+        files = []
+        self.add_files(self._version_path, files)
+        return files
+
+    def add_files(self, dir_path: str, files: list):  # Files of the sub folders first, like os.walk(topdown=False)
+        record = self._dirs.get(dir_path)
+        if record is None:
+            return
+        for subdir in record[2]:
+            self.add_files(subdir, files)
+        files.extend(record[3])
+
+    def scan_dir(self, dir_path: str, mtime_ns):
+        listed_ns = time.time_ns()
+        subdirs, files = self.list_dir(dir_path)
+        self._dirs[dir_path] = (mtime_ns, listed_ns, [subdir for subdir, subdir_mtime_ns in subdirs], files)
+        for subdir, subdir_mtime_ns in subdirs:
+            self.scan_dir(subdir, subdir_mtime_ns)
+
+    def rescan_dir(self, dir_path: str, mtime_ns):
+        old_subdirs = set(self._dirs[dir_path][2])
+        listed_ns = time.time_ns()
+        subdirs, files = self.list_dir(dir_path)
+        self._dirs[dir_path] = (mtime_ns, listed_ns, [subdir for subdir, subdir_mtime_ns in subdirs], files)
+        for subdir, subdir_mtime_ns in subdirs:
+            if subdir not in old_subdirs:
+                self.scan_dir(subdir, subdir_mtime_ns)
+        for subdir in old_subdirs - {subdir for subdir, subdir_mtime_ns in subdirs}:
+            self.remove_dir(subdir)
+
+    def remove_dir(self, dir_path: str):
+        record = self._dirs.pop(dir_path, None)
+        if record is not None:
+            for subdir in record[2]:
+                self.remove_dir(subdir)
+
+    @staticmethod
+    def stat_file(file: tuple) -> tuple:
+        path, rel_path, extension, size, mtime_ns = file
+        try:
+            stat = os.stat(path)
+            return path, rel_path, extension, stat.st_size, stat.st_mtime_ns
+        except OSError:
+            return path, rel_path, extension, None, None
+
+    def list_dir(self, dir_path: str) -> tuple:
+        subdirs = []
+        files = []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if not entry.is_symlink():  # Like os.walk, linked folders are not walked into
+                            try:
+                                subdir_mtime_ns = entry.stat(follow_symlinks=False).st_mtime_ns
+                            except OSError:  # Listed again by every refresh
+                                subdir_mtime_ns = None
+                            subdirs.append((entry.path, subdir_mtime_ns))
+                    elif entry.name.endswith(FileManifest.EXTENSIONS):
+                        try:
+                            stat = entry.stat()
+                            size, file_mtime_ns = stat.st_size, stat.st_mtime_ns
+                        except OSError:  # E.g. a broken link, the stages fail on it the same way as before
+                            size, file_mtime_ns = None, None
+                        files.append((entry.path, entry.path[self._prefix_length:], os.path.splitext(entry.name)[1],
+                                      size, file_mtime_ns))
+        except OSError:  # Like os.walk, folders that cannot be listed are skipped
+            pass
+        return subdirs, files
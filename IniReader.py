@@ -0,0 +1,120 @@
+import ast
+import io
+import logging
+
+
+class IniReader:
+    PARSER_XPERT = 'xpert'
+    PARSER_PYINICONFIG = 'pyiniconfig'
+    PARSER_COMPARE = 'compare'
+    PARSERS = (PARSER_XPERT, PARSER_PYINICONFIG, PARSER_COMPARE)
+    # Same first chars pyiniconfig refuses as an option line. ';' is not in the list (pyiniconfig has '~;' instead),
+    # so commented lines that contain '=' are read as options, exactly as pyiniconfig does
+    PROHIBITED_CHARS = frozenset(['&', '.', ')', '-', '?', '[', '!', '\\', ']', '*', '+', "'", '|', '<', '#', '=', ',',
+                                  '}', '(', '/', '{', ':', '@', '^', '№', '>'])
+    LITERAL_NAMES = ('True', 'False', 'None')
+
+    @staticmethod
+    def read_keys(file_path: str, parser: str = PARSER_XPERT):
+        # Yields (section, key, value) triples of an INI file with the chosen parser
+        match parser:
+            case IniReader.PARSER_PYINICONFIG:
+                return IniReader.read_keys_pyiniconfig(file_path)
+            case IniReader.PARSER_COMPARE:
+                return IniReader.read_keys_compare(file_path)
+            case _:
+                return IniReader.read_keys_xpert(file_path)
+
+    @staticmethod
+    def read_keys_xpert(file_path: str):
+        # Reads the file once and yields the same values pyiniconfig returns from get_sections() + get_options()
+        with open(file_path, 'r', encoding='utf-8') as file:
+            blocks = IniReader.read_sections(file)
+        return IniReader.get_keys(blocks)
+
+    @staticmethod
+    def read_keys_content(content: bytes):
+        # Same as read_keys_xpert for the bytes of a file that was already read
+        with io.TextIOWrapper(io.BytesIO(content), encoding='utf-8') as file:
+            blocks = IniReader.read_sections(file)
+        return IniReader.get_keys(blocks)
+
+    @staticmethod
+    def get_keys(blocks: list):
+        if not blocks:
+            return
+        last_section = blocks[-1][0]
+        merged = {}
+        if len(blocks) != len({name for name, options in blocks}):  # Duplicated sections, merge them like pyiniconfig
+            for name, options in blocks[:-1]:
+                if name != last_section:
+                    merged.setdefault(name, {}).update(options)
+        for name, options in blocks:
+            if not name.strip():
+                raise ValueError("Section name could not be empty.")
+            if name == last_section:
+                options = blocks[-1][1]
+            else:
+                options = merged.get(name, options)
+            for key, value in options.items():
+                yield name, key, value
+
+    @staticmethod
+    def read_sections(file) -> list:
+        # Single pass over the file lines, returns [(section, {key: value}), ...] in file order
+        blocks = []
+        options = None
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('['):
+                options = {}
+                blocks.append((IniReader.get_section(line), options))
+            elif options is not None and line[0] not in IniReader.PROHIBITED_CHARS and '=' in line:
+                parts = line.split('=')
+                options[parts[0].strip()] = IniReader.parse_value(parts[1].strip())
+        return blocks
+
+    @staticmethod
+    def get_section(line: str) -> str:
+        # Section name of a "[name] ; comment" line, raises on the lines pyiniconfig rejects
+        comment_index = min((i for i in (line.find(';'), line.find('#')) if i > 0), default=-1)
+        if comment_index > 0:
+            line = line[:comment_index]
+        if '=' in line:
+            raise ValueError("Char \"=\" is prohibited to use on section line.")
+        if line.count('[') != 1 or line.count(']') != 1:
+            raise ValueError("Amount of \"[\" and \"]\" have to be 1.")
+        return line[line.index('[') + 1:line.index(']')]
+
+    @staticmethod
+    def parse_value(value: str):
+        if not value:
+            return None
+        if value.isidentifier() and value not in IniReader.LITERAL_NAMES:  # Plain words are never literals
+            return value
+        try:
+            return ast.literal_eval(value)
+        except Exception:
+            return value
+
+    @staticmethod
+    def read_keys_pyiniconfig(file_path: str):
+        import pyiniconfig
+        config = pyiniconfig.IniConfig(file_path)
+        for section in config.get_sections():
+            options = config.get_options(section_name=section)
+            for key in options:
+                yield section, key, options[key]
+
+    @staticmethod
+    def read_keys_compare(file_path: str):
+        # Rollout helper: log every difference between both parsers and keep the pyiniconfig values
+        xpert_keys = list(IniReader.read_keys_xpert(file_path))
+        pyiniconfig_keys = list(IniReader.read_keys_pyiniconfig(file_path))
+        if xpert_keys != pyiniconfig_keys:
+            logging.warning(f"INI parsers disagree on {file_path}: "
+                            f"{[k for k in xpert_keys if k not in pyiniconfig_keys]} vs "
+                            f"{[k for k in pyiniconfig_keys if k not in xpert_keys]}")
+        yield from pyiniconfig_keys
@@ -1,4 +1,4 @@
-import typing
+from array import array
 from enum import Enum
 from DefaultValue import DefaultValue
 import logging
@@ -14,6 +14,8 @@ class Result(Enum):
 
 
 class KeyResult:
+    __slots__ = ('_expected', '_actual', '_result')  # One instance per key, no __dict__
+
     def __init__(self, expected, actual=None, result=Result.NONE):
         self._expected = expected
         self._actual = actual
@@ -39,31 +41,41 @@ class KeyResult:
     def result(self):
         return self._result
 
-    def validate(self, actual_to_validate: typing.Union[int, str, tuple, bool, float, list]):
-        # Actual can be of any type
-        self._actual = actual_to_validate
-        expected_val = str(self.expected)
-        logging.info(f"Validating {self._actual} vs {expected_val}")
-        if type(self._actual) is tuple:
-            actual = ','.join(map(str, self._actual))
-        elif type(self.actual) is not list and type(self.actual) is not tuple:
-            expected_val = expected_val.lower()
-            if type(self.actual) is bool:
-                actual = str(self.actual).lower()
-            elif type(self.actual) is float:
-                if self.actual.is_integer():
-                    actual = str(int(self.actual))
+    @staticmethod
+    def compare_values(expected_values: list, actuals: list, errors: dict = None) -> array:
+        # Classifies many keys at once, returns the Result.value of each key and 0 for the keys that could not be
+        # compared, their position -> error is added to errors. Values are compared as lower case text, a float with
+        # an integer value as the integer, and a tuple as its items joined by ',' without changing the case
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            for expected, actual in zip(expected_values, actuals):
+                logging.info("Validating %s vs %s", actual, expected)
+        codes = array('b')
+        for position, (expected, actual) in enumerate(zip(expected_values, actuals)):
+            try:  # A key that fails is not compared, the other keys are
+                expected_text = str(expected)
+                actual_type = type(actual)
+                if expected_text.__contains__('<'):
+                    codes.append(Result.VALIDATE_MANUALLY.value)
+                    continue
+                if actual_type is list:
+                    raise ValueError(f"list value {actual} can only be validated manually")
+                if actual_type is tuple:  # Tuples are compared as is
+                    actual_text = ','.join(map(str, actual))
                 else:
-                    actual = str(self.actual)
-            else:  # type(actual) is int
-                actual = str(self.actual).lower()
-        # noinspection PyUnboundLocalVariable
-        if expected_val.__contains__('<'):
-            self._result = Result.VALIDATE_MANUALLY
-        elif expected_val != actual:
-            if actual != DefaultValue.DEFAULT_VALUE_INI and actual != DefaultValue.DEFAULT_VALUE_JSON:
-                self._result = Result.NOT_EQUAL
-            else:  # actual == default_value
-                self._result = Result.UNMODIFICATION
-        else:  # expected_val == actual
-            self._result = Result.OK
+                    expected_text = expected_text.lower()
+                    if actual_type is float and actual.is_integer():
+                        actual_text = str(int(actual))
+                    else:
+                        actual_text = (actual if actual_type is str else str(actual)).lower()
+            except Exception as err:
+                codes.append(0)
+                if errors is not None:
+                    errors[position] = err
+                continue
+            if expected_text == actual_text:
+                codes.append(Result.OK.value)
+            elif actual_text == DefaultValue.DEFAULT_VALUE_INI:  # DEFAULT_VALUE_JSON is an int, never equals the text
+                codes.append(Result.UNMODIFICATION.value)
+            else:
+                codes.append(Result.NOT_EQUAL.value)
+        return codes
@@ -0,0 +1,40 @@
+import logging
+import logging.handlers
+import queue
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    # Hands records to a QueueListener thread that writes them, so per-key logging does not wait for the log file
+    MAX_QUEUED_RECORDS = 100000
+
+    def __init__(self, handler: logging.Handler):
+        super().__init__(queue.Queue(maxsize=LogQueueHandler.MAX_QUEUED_RECORDS))
+        self.setFormatter(logging.Formatter('%(message)s'))  # The listener handler adds its own format
+        self._listener = logging.handlers.QueueListener(self.queue, handler, respect_handler_level=True)
+        self._dropped = 0
+
+    def start(self):
+        self._listener.start()
+
+    def stop(self):  # Writes all queued records
+        self._listener.stop()
+        if self._dropped:
+            self._listener.handlers[0].handle(logging.makeLogRecord(
+                {'levelno': logging.WARNING, 'levelname': 'WARNING', 'funcName': 'stop',
+                 'msg': f"{self._dropped} log records below WARNING were dropped while the log queue was full"}))
+        self._listener.handlers[0].close()
+
+    def prepare(self, record: logging.LogRecord):
+        # Warnings and errors are formatted now with their traceback, lower records are formatted by the listener
+        if record.levelno >= logging.WARNING:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if record.levelno >= logging.WARNING:  # Never dropped, waits for room in the queue
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._dropped += 1
@@ -0,0 +1,98 @@
+import argparse
+import csv
+import os
+import sys
+from KeyResult import Result
+from ResultsDatabase import ResultsDatabase
+
+
+def define_inputs(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Query the results database written by XPERT with --results_db")
+    parser.add_argument("-d", "--db", required=True, help="The results database, Results\\results.db")
+    parser.add_argument("-o", "--output", required=False, help="Write the rows as CSV to this file instead of stdout")
+    parser.add_argument("-v", "--vendor", required=False, help="Only runs of this MRI vendor")
+    parser.add_argument("-m", "--mr_model", required=False, help="Only runs of this MR model")
+    parser.add_argument("-f", "--field", required=False, help="Only runs of this field strength")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runs = commands.add_parser("runs", help="List the runs, newest first")
+    runs.add_argument("--limit", type=int, default=None, help="Number of runs to list")
+    results = commands.add_parser("results", help="Key results of the runs matching every filter")
+    results.add_argument("--runs", type=int, nargs="+", required=False, help="Run ids, default is every run")
+    results.add_argument("--last", type=int, required=False, help="Only the last runs of -v, -m and -f")
+    results.add_argument("--version", required=False, help="FUS version, e.g. Fus-7.44")
+    results.add_argument("--file", required=False,
+                         help="File without the version, %% and _ are wildcards, e.g. %%SiteInifiles%%")
+    results.add_argument("--section", required=False, help="Section of the key")
+    results.add_argument("--key", required=False, help="Name of the key")
+    results.add_argument("--status", nargs="+", choices=[result.name for result in Result], required=False,
+                         help="Only keys with these statuses")
+    diff = commands.add_parser("diff", help="Keys whose status differs between two runs")
+    diff.add_argument("--old_run", type=int, required=False,
+                      help="Run id, default is the run before the last run of -v, -m and -f")
+    diff.add_argument("--new_run", type=int, required=False, help="Run id, default is the last run of -v, -m and -f")
+    diff.add_argument("--old_version", required=False,
+                      help="With --new_version, compare the keys of this version to the keys of --new_version")
+    diff.add_argument("--new_version", required=False, help="Version of --new_run compared to --old_version")
+    diff.add_argument("--status", nargs="+", choices=[result.name for result in Result], required=False,
+                      help="Only keys whose status in the new run is one of these, e.g. NOT_EQUAL")
+    arguments = parser.parse_args(argv)
+    if not os.path.exists(arguments.db):
+        parser.error(f"{arguments.db} does not exist")
+    if arguments.command == "diff" and (arguments.old_version is None) != (arguments.new_version is None):
+        parser.error("--old_version and --new_version are given together")
+    return arguments
+
+
+def get_last_runs(database: ResultsDatabase, arguments: argparse.Namespace, count: int) -> list:
+    # Ids of the last runs of -v, -m and -f, oldest first
+    runs = database.get_runs(arguments.vendor, arguments.mr_model, arguments.field, count)
+    if len(runs) < count:
+        raise Exception(f"Found {len(runs)} runs of {arguments.vendor}, {arguments.mr_model}, {arguments.field}, "
+                        f"{count} are needed")
+    return [run[0] for run in reversed(runs)]
+
+
+def query(database: ResultsDatabase, arguments: argparse.Namespace) -> tuple:  # Column names and the rows
+    match arguments.command:
+        case "runs":
+            return (['run_id', 'time', 'vendor', 'mr_model', 'field_strength', 'versions', 'output_path'],
+                    database.get_runs(arguments.vendor, arguments.mr_model, arguments.field, arguments.limit))
+        case "results":
+            run_ids = arguments.runs
+            if arguments.last is not None:
+                run_ids = get_last_runs(database, arguments, arguments.last)
+            return ResultsDatabase.RESULT_COLUMNS, database.get_results(
+                run_ids, arguments.vendor, arguments.mr_model, arguments.field, arguments.version, arguments.file,
+                arguments.section, arguments.key, arguments.status)
+        case "diff":
+            old_run, new_run = arguments.old_run, arguments.new_run
+            if old_run is None or new_run is None:
+                last_runs = get_last_runs(database, arguments, 2)
+                old_run = last_runs[0] if old_run is None else old_run
+                new_run = last_runs[1] if new_run is None else new_run
+            print(f"Comparing run {old_run} to run {new_run}", file=sys.stderr)
+            return ResultsDatabase.DIFF_COLUMNS, database.get_diff(old_run, new_run, arguments.old_version,
+                                                                   arguments.new_version, arguments.status)
+
+
+def write_rows(columns: list, rows, file) -> int:  # Rows are written as they are read, returns their number
+    writer = csv.writer(file, lineterminator='\n')
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(['None' if value is None else value for value in row])  # Like the output CSV
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    args = define_inputs()
+    results_database = ResultsDatabase(args.db)
+    column_names, result_rows = query(results_database, args)
+    if args.output is None:
+        row_count = write_rows(column_names, result_rows, sys.stdout)
+    else:
+        with open(args.output, 'w', newline='', encoding='utf-8') as output_file:
+            row_count = write_rows(column_names, result_rows, output_file)
+    print(f"{row_count} rows", file=sys.stderr)
+    results_database.close()
@@ -1,36 +1,63 @@
+import csv
+import hashlib
+import io
 import logging
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from collections import deque
 from datetime import datetime
-import pandas as pd
 import os
-import json5 as json
-import pyiniconfig
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import json
+import json5
+from IniReader import IniReader
 from KeyResult import KeyResult
 from KeyResult import Result
+from SkipIndex import SkipIndex
 from DefaultValue import DefaultValue
+from FileManifest import FileManifest
+from RequirementsTable import RequirementsTable
+from ValidationCache import ValidationCache
+
+
+_worker_requirements = None  # Requirements copy of a validation worker process
 
 
 class Requirements:
-    def __init__(self, mr_model, field, vendor, df: pd.DataFrame):
-        self._ini_files: IniFiles = IniFiles()
+    BATCHES_PER_JOB = 4
+    QUEUED_FILES_PER_THREAD = 4  # Files read ahead of the key checks by each reader thread
+    INIGUARD_LOG = os.path.join('Iniguard', 'Log')
+
+    def __init__(self, mr_model, field, vendor, df: RequirementsTable, ini_parser: str = IniReader.PARSER_XPERT):
+        self._ini_files: IniFiles = IniFiles(ini_parser)
         self._json_files: JsonFiles = JsonFiles()
         self._mr_model = mr_model
         self._field = field
         self._vendor = vendor
-        ls_path = (pd.unique(df['path'])).tolist()
-        for path in ls_path:
+        self._pipeline_metrics = None
+        if not isinstance(df, RequirementsTable):  # A DataFrame of a caller that read req.csv with pandas
+            df = RequirementsTable.from_df(df)
+        for path, df_path in df.group_by('path').items():  # One grouped pass instead of masking df per path
             file_ext = os.path.splitext(path)[1].lower()
             match file_ext:
                 case ".ini":
                     try:
-                        self._ini_files.add_file(path, df)
+                        self._ini_files.add_file(path, df_path)
                     except Exception as err:
                         logging.warning(f"Failed to add {path} to structure, error: {err}, type: {type(err)}")
                 case ".json":
                     try:
-                        self._json_files.add_file(path, df)
+                        self._json_files.add_file(path, df_path)
                     except Exception as err:
                         logging.warning(f"Failed to add {path} to structure, error: {err}, type: {type(err)}")
 
+    @property
+    def pipeline_metrics(self):  # Stage metrics of the last validate_files_pipelined
+        return self._pipeline_metrics
+
     @property
     def ini_files(self):
         return self._ini_files
@@ -39,175 +66,472 @@ class Requirements:
     def json_files(self):
         return self._json_files
 
-    def validate(self, version_path: str, files_to_skip: dict):
-        for root, dirs, files in os.walk(version_path, topdown=False):
-            for filename in files:
-                curr_path = os.path.join(root, filename)
-                if not curr_path.__contains__('Local') and not curr_path.__contains__('Iniguard\\Log'):
-                    # Without root: D:\FusWs - Fus-7.44\Site\SiteInifiles\example.ini
-                    path_no_root = os.sep.join(curr_path.split(os.sep)[2:])
-                    extension = os.path.splitext(filename)[1]
-                    path_no_version = os.sep.join(path_no_root.split(os.sep)[1:])  # Site\SiteInifiles\example.ini
-                    sections_to_skip = files_to_skip.get(path_no_version)
-                    match extension:
-                        case '.ini':
-                            self._ini_files.validate_file(curr_path, path_no_root, sections_to_skip)
-                        case '.json':
-                            self._json_files.validate_file(curr_path, path_no_root, sections_to_skip)
-
-    def output(self, dest_dir: str, versions: list):
-        ls_of_df = []
+    def validate(self, manifest: FileManifest, skip_index: SkipIndex, cache: ValidationCache = None,
+                 read_threads: int = 0) -> tuple:
+        files = Requirements.list_files(manifest, skip_index)
+        if cache is not None:
+            return self.validate_cached(files, cache, read_threads=read_threads)
+        return self.validate_files(files, read_threads)
+
+    def validate_parallel(self, manifests: list, skip_index: SkipIndex, jobs: int, log_config: dict = None,
+                          cache: ValidationCache = None) -> tuple:
+        files = [file for manifest in manifests for file in Requirements.list_files(manifest, skip_index)]
+        if cache is not None:
+            return self.validate_cached(files, cache, jobs, log_config)
+        return self.validate_files_parallel(files, jobs, log_config)
+
+    def validate_files_parallel(self, files: list, jobs: int, log_config: dict = None) -> tuple:
+        # Validate batches of files of all versions in worker processes and merge them in the serial order
+        batch_size = max(1, -(-len(files) // (jobs * Requirements.BATCHES_PER_JOB)))
+        batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+        logging.info(f"Validating {len(files)} files in {len(batches)} batches with {jobs} jobs")
+        with ProcessPoolExecutor(max_workers=jobs, initializer=Requirements.init_worker,
+                                 initargs=(self, log_config)) as executor:
+            keys = 0
+            for ini_rows, json_rows, batch_keys in executor.map(Requirements.validate_batch, batches):
+                self._ini_files.merge(ini_rows)
+                self._json_files.merge(json_rows)
+                keys += batch_keys
+        return len(files), keys
+
+    @staticmethod
+    def init_worker(requirements, log_config: dict):
+        global _worker_requirements
+        _worker_requirements = requirements
+        if log_config is not None:
+            logging.basicConfig(filemode='a', force=True, **log_config)  # Drop handlers inherited by fork
+
+    @staticmethod
+    def validate_batch(files: list) -> tuple:
+        # Runs in a worker, returns the results of the batch files only
+        validated_files, keys = _worker_requirements.validate_files(files)
+        paths = [path_no_root for curr_path, path_no_root, extension, sections_to_skip in files]
+        return _worker_requirements.ini_files.get_rows(paths), _worker_requirements.json_files.get_rows(paths), keys
+
+    @staticmethod
+    def list_files(manifest: FileManifest, skip_index: SkipIndex) -> list:
+        files_to_validate = []
+        root_length = len(os.path.dirname(manifest.version_path)) + len(os.sep)
+        for curr_path, path_no_version, extension, size, mtime_ns in manifest.get_files():
+            # Without root: D:\FusWs - Fus-7.44\Site\SiteInifiles\example.ini
+            path_no_root = curr_path[root_length:]
+            if not path_no_root.__contains__('Local') and not path_no_root.__contains__(Requirements.INIGUARD_LOG):
+                if extension != '.ini' and extension != '.json':
+                    continue
+                sections_to_skip = skip_index.get_keys(path_no_version)  # Site\SiteInifiles\example.ini
+                files_to_validate.append((curr_path, path_no_root, extension, sections_to_skip))
+        return files_to_validate
+
+    def validate_files(self, files: list, read_threads: int = 0) -> tuple:  # Returns the number of files and keys read
+        if read_threads > 0:
+            return self.validate_files_pipelined(files, read_threads)
+        keys = 0
         try:
-            df_ini_files = self._ini_files.create_df()
-            df_json_files = self._json_files.create_df()
-            ls_of_df.append(df_ini_files)
-            ls_of_df.append(df_json_files)
-        except Exception as err:
-            logging.error(f"Failed to create data frames, error: {err}, type: {type(err)}")
-            raise Exception(f"Failed to create data frames, error: {err}, type: {type(err)}")
+            for curr_path, path_no_root, extension, sections_to_skip in files:
+                match extension:
+                    case '.ini':
+                        keys += self._ini_files.validate_file(curr_path, path_no_root, sections_to_skip)
+                    case '.json':
+                        keys += self._json_files.validate_file(curr_path, path_no_root, sections_to_skip)
+        finally:  # Keys found before an error are not left for the next call
+            self._ini_files.validate_pending()
+            self._json_files.validate_pending()
+        return len(files), keys
+
+    def validate_cached(self, files: list, cache: ValidationCache, jobs: int = 1, log_config: dict = None,
+                        read_threads: int = 0) -> tuple:
+        # Reuses the results of the last run for files whose content and requirement rows did not change, the keys
+        # of reused files are not counted as read
+        files_to_validate = []
+        file_keys = {}
+        for curr_path, path_no_root, extension, sections_to_skip in files:
+            file_key = cache.get_file_key(curr_path, self.get_files(extension).get_requirements(path_no_root))
+            rows = cache.get(path_no_root, file_key)
+            if rows is None:
+                files_to_validate.append((curr_path, path_no_root, extension, sections_to_skip))
+                file_keys[path_no_root] = file_key
+            else:
+                self.get_files(extension).merge(rows)
+                cache.set(path_no_root, file_key, rows)
+        logging.info(f"Reusing the results of {len(files) - len(files_to_validate)} of {len(files)} files")
+        if jobs > 1:
+            validated_files, keys = self.validate_files_parallel(files_to_validate, jobs, log_config)
+        else:
+            validated_files, keys = self.validate_files(files_to_validate, read_threads)
+        for curr_path, path_no_root, extension, sections_to_skip in files_to_validate:
+            if file_keys[path_no_root] is not None:  # Not cached when its content could not be read
+                cache.set(path_no_root, file_keys[path_no_root], self.get_files(extension).get_rows([path_no_root]))
+        self.sort_files([path_no_root for curr_path, path_no_root, extension, sections_to_skip in files])
+        return validated_files, keys
+
+    def validate_files_pipelined(self, files: list, read_threads: int) -> tuple:
+        # Reader threads read and parse the next files while this thread checks the keys of the files in listing
+        # order. Listing waits while QUEUED_FILES_PER_THREAD files per reader are queued, so memory stays bounded
+        max_queued = read_threads * Requirements.QUEUED_FILES_PER_THREAD
+        metrics = {'read_threads': read_threads, 'files': len(files), 'keys': 0, 'read_s': 0.0, 'wait_s': 0.0,
+                   'check_s': 0.0, 'max_queued': 0}
+        queued = deque()  # (file, future of its keys) in listing order
+        files_to_queue = iter(files)
+        try:
+            with ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix='Reader') as executor:
+                def queue_files():
+                    for file in files_to_queue:
+                        queued.append((file, executor.submit(self.read_file_keys, file)))
+                        if len(queued) >= max_queued:
+                            break
+                    metrics['max_queued'] = max(metrics['max_queued'], len(queued))
+                try:
+                    queue_files()
+                    while queued:
+                        (curr_path, path_no_root, extension, sections_to_skip), future = queued.popleft()
+                        start = time.perf_counter()
+                        keys, read_seconds = future.result()  # Waits when the readers are behind
+                        metrics['wait_s'] += time.perf_counter() - start
+                        metrics['read_s'] += read_seconds
+                        queue_files()  # Keep the readers busy while the keys are checked
+                        start = time.perf_counter()
+                        metrics['keys'] += self.get_files(extension).check_keys(path_no_root, sections_to_skip, keys)
+                        metrics['check_s'] += time.perf_counter() - start
+                finally:  # Files queued after an error are not read
+                    for file, future in queued:
+                        future.cancel()
+        finally:  # Keys found before an error are not left for the next call
+            self._ini_files.validate_pending()
+            self._json_files.validate_pending()
+            self._pipeline_metrics = {name: round(value, 4) if type(value) is float else value
+                                      for name, value in metrics.items()}
+            logging.info(f"Validation pipeline: {self._pipeline_metrics}")
+        return len(files), metrics['keys']
+
+    def read_file_keys(self, file: tuple) -> tuple:  # Runs in a reader thread, returns the keys and the seconds taken
+        start = time.perf_counter()
+        keys = self.get_files(file[2]).read_keys(file[0], file[1])
+        return keys, time.perf_counter() - start
+
+    def revalidate_files(self, files: list) -> tuple:  # Validate files again, dropping their earlier results
+        for curr_path, path_no_root, extension, sections_to_skip in files:
+            self.reset_file(path_no_root, extension)
+        return self.validate_files(files)
+
+    def reset_file(self, path_no_root: str, extension: str):
+        match extension:
+            case '.ini':
+                self._ini_files.reset_file(path_no_root)
+            case '.json':
+                self._json_files.reset_file(path_no_root)
+
+    def get_files(self, extension: str):
+        return self._json_files if extension == '.json' else self._ini_files
+
+    def set_parsed(self, ini_parsed: OrderedDict, json_parsed: OrderedDict):  # Parsed files shared with other runs
+        self._ini_files.set_parsed(ini_parsed)
+        self._json_files.set_parsed(json_parsed)
+
+    def clear_parsed(self):  # Parsed files are not needed after the validation
+        self._ini_files.clear_parsed()
+        self._json_files.clear_parsed()
+
+    def sort_files(self, paths: list):  # Output order of validating paths in this order
+        self._ini_files.sort_files(paths)
+        self._json_files.sort_files(paths)
+
+    def output(self, dest_dir: str, versions: list) -> str:
         if self._mr_model.__contains__('/'):
             self._mr_model = self._mr_model.replace('/', '_')
         filename = self._vendor + '_' + self._mr_model + '_' + self._field + '_' + "_".join(
             versions) + '_' + datetime.now().strftime('%m%d_%H%M') + '.csv'
         if not os.path.exists(os.path.join(dest_dir, 'Results')):
             os.makedirs(os.path.join(dest_dir, 'Results'))
-        try:
-            pd.concat(ls_of_df).to_csv(path_or_buf=os.path.join(dest_dir, 'Results', filename), index=False, na_rep='None')
+        try:  # Same CSV as DataFrame.to_csv(index=False, na_rep='None') of create_df() of both, without pandas
+            with open(os.path.join(dest_dir, 'Results', filename), 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file, lineterminator=os.linesep)
+                writer.writerow(Files.COL_NAMES)
+                writer.writerows(self._ini_files.get_output_rows())
+                writer.writerows(self._json_files.get_output_rows())
         except Exception as err:
             logging.error(f"Failed to create output file, error: {err}, type: {type(err)}")
             raise Exception(f"Failed to create output file, error: {err}, type: {type(err)}")
         logging.info("Output is in: " + os.path.join(dest_dir, "Results"))
+        return os.path.join(dest_dir, 'Results', filename)
+
+    def get_results(self):  # (file, section, key, expected, actual, status) of every key, in the order of the output
+        yield from self._ini_files.get_results()
+        yield from self._json_files.get_results()
 
 
 class Files:
     DELIMITER_FOR_LIST = ';'
+    COL_NAMES = ['File', 'Section', 'Key', 'Expected', 'Actual', 'Status']
+    NA_REP = 'None'  # Text of None and NaN values in the output
+    STATUS_NAMES = [None] + [result.name for result in Result]  # Name of each Result.value
+    # Parsed files kept to reuse for identical contents, e.g. the same site file in the next version. The least
+    # recently used are dropped, so memory does not grow with the number of files in the tree
+    MAX_PARSED_FILES = 10000
 
     def __init__(self):
-        self._files: dict = {}
-
-    def __getitem__(self, item):
-        return self._files[item]
-
-    def create_df(self):
-        col_names = ['File', 'Section', 'Key', 'Expected', 'Actual', 'Status']
-        df = pd.DataFrame(columns=col_names)  # Create empty df
-        for path in self._files:
-            for section in self._files[path]:
-                for key in self._files[path][section]:
-                    key_result = self._files[path][section][key]
-                    if type(key_result.actual) is str:
-                        if key_result.actual.startswith('-'):
-                            key_result.actual = " " + key_result.actual
-                    if type(key_result.expected) is str:
-                        if key_result.expected.startswith('-'):
-                            key_result.expected = " " + key_result.expected
-                    new_row = {'File': path, 'Section': section, 'Key': key, 'Expected': key_result.expected,
-                               'Actual': key_result.actual,
-                               'Status': key_result.result.name}
-                    df.loc[len(df)] = new_row
-        return df
-
-    def add_file(self, path: str, df: pd.DataFrame):
-        df_path = df[df['path'] == path]
-        ls_sections = (pd.unique(df_path['section'])).tolist()
-        sections = {}
-        for section in ls_sections:
-            sections[section] = {}
-            df_section = df[(df['path'] == path) & (df['section'] == section)]
-            ls_keys = (pd.unique(df_section['ini key'])).tolist()
-            for key in ls_keys:
-                expected_val = df_section.loc[df_section['ini key'] == key, 'value'].item()
-                if str(expected_val).__contains__(self.DELIMITER_FOR_LIST):
-                    ls_expected_val = expected_val.split(self.DELIMITER_FOR_LIST)
-                    sections[section][key] = KeyResult(ls_expected_val)
-                else:
-                    sections[section][key] = KeyResult(expected_val)
-        self._files[path] = sections
-
-    def validate_file(self, full_file_path, no_root_file_path, sections_to_skip):
+        # Columnar store, one row per key in parallel columns, the index keeps the order of the output
+        self._index: dict = {}  # file -> section -> key -> row
+        self._expected_col: list = []
+        self._actual_col: list = []
+        self._result_col = array('b')  # Result.value
+        self._requirement_rows = 0  # Rows and files of req.csv come first, the rest were added by validation
+        self._requirement_files = 0
+        self._parsed = OrderedDict()  # Content hash -> (section, key, actual) of the file, least recently used first
+        self._pending: list = []  # (file, section, key, row, actual) compared together by validate_pending
+
+    def __getstate__(self):  # Parsed files are not copied to the cache or to worker processes
+        state = self.__dict__.copy()
+        state['_parsed'] = OrderedDict()
+        return state
+
+    def set_parsed(self, parsed: OrderedDict):
+        self._parsed = parsed
+
+    def clear_parsed(self):
+        self._parsed.clear()
+
+    def __getitem__(self, item):  # {section: {key: KeyResult}} of a file
+        return {section: {key: KeyResult(self._expected_col[row], actual=self._actual_col[row],
+                                         result=Result(self._result_col[row])) for key, row in keys.items()}
+                for section, keys in self._index[item].items()}
+
+    def create_df(self):  # pandas is imported only by callers that need a DataFrame
+        import pandas as pd
+        col_names = Files.COL_NAMES
+        columns = {col_name: [] for col_name in col_names}  # Collect columns and build the df once
+        rows = []
+        for path, sections in self._index.items():
+            for section, keys in sections.items():
+                columns['File'].extend([path] * len(keys))
+                columns['Section'].extend([section] * len(keys))
+                columns['Key'].extend(keys.keys())
+                rows.extend(keys.values())
+        columns['Expected'] = [Files.pad_negative(self._expected_col[row]) for row in rows]
+        columns['Actual'] = [Files.pad_negative(self._actual_col[row]) for row in rows]
+        columns['Status'] = [Files.STATUS_NAMES[self._result_col[row]] for row in rows]
+        return pd.DataFrame(columns, columns=col_names, dtype=object)
+
+    def get_output_rows(self):  # Rows of the output CSV, in the order of create_df()
+        for path, sections in self._index.items():
+            for section, keys in sections.items():
+                for key, row in keys.items():
+                    yield (Files.to_output(path), Files.to_output(section), Files.to_output(key),
+                           Files.to_output(Files.pad_negative(self._expected_col[row])),
+                           Files.to_output(Files.pad_negative(self._actual_col[row])),
+                           Files.to_output(Files.STATUS_NAMES[self._result_col[row]]))
+
+    @staticmethod
+    def to_output(value):  # None and NaN are written as na_rep of DataFrame.to_csv
+        if value is None or (type(value) is float and value != value):
+            return Files.NA_REP
+        return value
+
+    def get_results(self):
+        for path, sections in self._index.items():
+            for section, keys in sections.items():
+                for key, row in keys.items():
+                    yield (path, section, key, self._expected_col[row], self._actual_col[row],
+                           Files.STATUS_NAMES[self._result_col[row]])
+
+    @staticmethod
+    def pad_negative(value):  # Leading space keeps negative values as text when the CSV is opened in Excel
+        if type(value) is str and value.startswith('-'):
+            return " " + value
+        return value
+
+    @staticmethod
+    def intern(value):  # Sections and keys repeat in every version, keep one copy of each
+        return sys.intern(value) if type(value) is str else value
+
+    def add_row(self, file: str, section: str, key: str, expected, actual=None, result: int = Result.NONE.value):
+        keys = self._index.setdefault(Files.intern(file), {}).setdefault(Files.intern(section), {})
+        keys[Files.intern(key)] = len(self._result_col)
+        self._expected_col.append(expected)
+        self._actual_col.append(actual)
+        self._result_col.append(result)
+
+    def add_file(self, path: str, df_path: RequirementsTable):  # df_path holds the requirement rows of path only
+        new_rows = {}
+        for section, key, expected_val in zip(df_path['section'], df_path['ini key'], df_path['value']):
+            if (section, key) in new_rows:  # Same error .item() raised for a key with more than one value
+                raise ValueError("can only convert an array of size 1 to a Python scalar")
+            if str(expected_val).__contains__(self.DELIMITER_FOR_LIST):
+                new_rows[(section, key)] = expected_val.split(self.DELIMITER_FOR_LIST)
+            else:
+                new_rows[(section, key)] = expected_val
+        for (section, key), expected_val in new_rows.items():
+            self.add_row(path, section, key, expected_val)
+        self._requirement_rows = len(self._result_col)
+        self._requirement_files = len(self._index)
+
+    def reset_file(self, path: str):  # Back to the state before path was validated
+        sections = self._index.get(path)
+        if sections is None:
+            return
+        for section, keys in list(sections.items()):
+            for key, row in list(keys.items()):
+                self._actual_col[row] = None
+                if row < self._requirement_rows:
+                    self._result_col[row] = Result.NONE.value
+                else:  # Added by validation, the row is left unused
+                    del keys[key]
+            if not keys:
+                del sections[section]
+        if not sections:
+            del self._index[path]
+
+    def sort_files(self, paths: list):
+        # Files without requirements are added in validation order, put them in the order of paths after the files
+        # of earlier validations
+        positions = {path: i for i, path in enumerate(paths)}
+        files = list(self._index.items())
+        added_files = sorted(files[self._requirement_files:], key=lambda item: positions.get(item[0], -1))
+        self._index = dict(files[:self._requirement_files] + added_files)
+
+    def get_requirements(self, path: str) -> list:  # (section, key, expected) of the req.csv rows of path
+        return [(section, key, self._expected_col[row]) for section, keys in self._index.get(path, {}).items()
+                for key, row in keys.items() if row < self._requirement_rows]
+
+    def get_rows(self, paths: list) -> list:  # Keys of the files a worker validated or added, in output order
+        rows = []
+        for path in paths:
+            for section, keys in self._index.get(path, {}).items():
+                for key, row in keys.items():
+                    if self._actual_col[row] is not None or self._result_col[row] != Result.NONE.value:
+                        rows.append((path, section, key, self._expected_col[row], self._actual_col[row],
+                                     self._result_col[row]))
+        return rows
+
+    def merge(self, rows: list):
+        for file, section, key, expected, actual, result in rows:
+            row = self._index.get(file, {}).get(section, {}).get(key)
+            if row is None:
+                self.add_row(file, section, key, expected, actual, result)
+            else:
+                self._expected_col[row] = expected
+                self._actual_col[row] = actual
+                self._result_col[row] = result
+
+    def validate_file(self, full_file_path: str, no_root_file_path: str, sections_to_skip: dict) -> int:
+        return self.check_keys(no_root_file_path, sections_to_skip, self.read_keys(full_file_path, no_root_file_path))
+
+    def check_keys(self, no_root_file_path: str, sections_to_skip: dict, keys: list) -> int:
+        for section, key, actual in keys:
+            if sections_to_skip is None:  # There are no keys to skip in this file
+                try:
+                    self.handle_key(no_root_file_path, section, key, actual)
+                except Exception as err:
+                    logging.warning(f"Failed to validate: {no_root_file_path}, {section}, {key} - err: {err}, "
+                                    f"type: {type(err)}")
+            elif key not in sections_to_skip.get(section, {}):  # This key is not a skipped key
+                try:
+                    self.handle_key(no_root_file_path, section, key, actual)
+                except Exception as err:
+                    logging.warning(f"Failed to validate: {no_root_file_path}, {section}, {key} - err: {err},"
+                                    f" type: {type(err)}")
+        return len(keys)
+
+    def read_keys(self, full_file_path: str, no_root_file_path: str) -> list:
+        # Identical files, e.g. the same site file in several versions, are parsed once
+        with open(full_file_path, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha256(content).digest()
+        keys = self._parsed.get(digest)
+        if keys is None:
+            keys = self.parse_keys(content, no_root_file_path)
+            self._parsed[digest] = keys
+            if len(self._parsed) > Files.MAX_PARSED_FILES:
+                try:
+                    self._parsed.popitem(last=False)
+                except KeyError:  # Emptied by another reader thread
+                    pass
+        else:
+            try:
+                self._parsed.move_to_end(digest)
+            except KeyError:  # Dropped by another reader thread meanwhile
+                pass
+        return keys
+
+    def parse_keys(self, content: bytes, no_root_file_path: str) -> list:
         pass
 
+    def validate_pending(self):  # Compare the values of all the keys found since the last call
+        pending, self._pending = self._pending, []
+        errors = {}  # Position in pending -> error of the keys that could not be compared
+        codes = KeyResult.compare_values([self._expected_col[pending_key[3]] for pending_key in pending],
+                                         [pending_key[4] for pending_key in pending], errors)
+        for position, ((file_path, section, key, row, actual), code) in enumerate(zip(pending, codes)):
+            self._actual_col[row] = actual
+            if code:
+                self._result_col[row] = code
+            else:
+                err = errors[position]
+                logging.warning(f"Failed to compare values: {file_path}, {section}, {key}, error: {err}, "
+                                f"type: {type(err)}")
+
     def handle_key(self, file_path: str, section: str, key: str, actual: object):
-        logging.info(f"Check key {key} in section {section} in file {file_path}")
-        key_result = self._files.get(file_path, {}).get(section, {}).get(key)
-        if key_result is not None:  # Key is in data
-            logging.info(f"key {key} in section {section} in file {file_path} exists in data")
-            try:
-                key_result.validate(actual)
-            except Exception as err:
-                logging.warning(
-                    f"Failed to compare values: {file_path}, {section}, {key}, error: {err}, type: {type(err)}")
+        logging.info("Check key %s in section %s in file %s", key, section, file_path)
+        row = self._index.get(file_path, {}).get(section, {}).get(key)
+        if row is not None:  # Key is in data
+            logging.info("key %s in section %s in file %s exists in data", key, section, file_path)
+            self._pending.append((file_path, section, key, row, actual))
         else:  # Key is not in data
             if actual != DefaultValue.DEFAULT_VALUE_JSON and actual != DefaultValue.DEFAULT_VALUE_INI:
-                logging.info(f"Adding key {key} in section {section} in file {file_path} to data")
-                self._files.setdefault(file_path, {}).setdefault(section, {}).setdefault(key, KeyResult(
-                    DefaultValue.DEFAULT_VALUE_INI, actual=actual,
-                    result=Result.UNEXPECTED_MODIFICATION))
+                logging.info("Adding key %s in section %s in file %s to data", key, section, file_path)
+                self.add_row(file_path, section, key, DefaultValue.DEFAULT_VALUE_INI, actual=actual,
+                             result=Result.UNEXPECTED_MODIFICATION.value)
 
 
 class IniFiles(Files):
-    def validate_file(self, full_file_path: str, no_root_file_path: str, sections_to_skip: dict):
-        config = pyiniconfig.IniConfig(full_file_path)
-        for section in config.get_sections():
-            options = config.get_options(section_name=section)
-            for key in options:
-                if sections_to_skip is None:  # There are no keys to skip in this file
-                    try:
-                        self.handle_key(no_root_file_path, section, key, options[key])
-                    except Exception as err:
-                        logging.warning(f"Failed to validate: {no_root_file_path}, {section}, {key} - err: {err}, "
-                                        f"type: {type(err)}")
-                elif key not in sections_to_skip.get(section, {}):  # This key is not a skipped key
-                    try:
-                        self.handle_key(no_root_file_path, section, key, options[key])
-                    except Exception as err:
-                        logging.warning(f"Failed to validate: {no_root_file_path}, {section}, {key} - err: {err},"
-                                        f" type: {type(err)}")
+    def __init__(self, ini_parser: str = IniReader.PARSER_XPERT):
+        super().__init__()
+        self._ini_parser = ini_parser
+
+    def read_keys(self, full_file_path: str, no_root_file_path: str) -> list:
+        if self._ini_parser != IniReader.PARSER_XPERT:  # pyiniconfig reads the file by itself
+            return list(IniReader.read_keys(full_file_path, self._ini_parser))
+        return super().read_keys(full_file_path, no_root_file_path)
+
+    def parse_keys(self, content: bytes, no_root_file_path: str) -> list:
+        return list(IniReader.read_keys_content(content))
 
 
 class JsonFiles(Files):
-    def validate_file(self, full_file_path: str, no_root_file_path: str, sections_to_skip: dict):
+    def parse_keys(self, content: bytes, no_root_file_path: str) -> list:
         try:
-            with open(full_file_path, "r") as f:
+            with io.TextIOWrapper(io.BytesIO(content)) as f:  # Same decoding as open(path, "r")
                 file_data = f.read()
-                json_data = json.loads(file_data)
+                json_data = JsonFiles.load_json(file_data)
         except Exception as err:
             logging.warning(f"Failed to open: {no_root_file_path}, err: {err}, type: {type(err)}")
+        keys = []
         if file_data[0] == '{':
             for tag, actual in JsonFiles.extract_tags_and_values(json_data):
-                section = tag[:tag.rfind(".")]
-                key = tag.split('.')[-1]
-                if sections_to_skip is None:
-                    try:
-                        self.handle_key(no_root_file_path, section, key, actual)
-                    except Exception as err:
-                        logging.warning(f"Failed to validate: {no_root_file_path}, {section}, {key} - err: {err}, "
-                                        f"type: {type(err)}")
-                elif key not in sections_to_skip.get(section, {}):
-                    try:
-                        self.handle_key(no_root_file_path, section, key, actual)
-                    except Exception as err:
-                        logging.warning(f"Failed to validate: {no_root_file_path}, {section}, {key} - err: {err},"
-                                        f" type: {type(err)}")
+                dot_index = tag.rfind(".")
+                keys.append((tag[:dot_index], tag[dot_index + 1:], actual))
+        return keys
 
     @staticmethod
-    def extract_tags_and_values(data: dict, prefix=""):
-        results = []
-        if isinstance(data, dict):
-            for key, value in data.items():
-                new_prefix = f"{prefix}.{key}" if prefix else key
-                if isinstance(value, list):
-                    results.append((new_prefix, value))
-                else:
-                    results.extend(JsonFiles.extract_tags_and_values(value, new_prefix))
-        elif isinstance(data, list):
-            for i, item in enumerate(data):
-                new_prefix = f"{prefix}[{i}]" if prefix else f"[{i}]"
-                if isinstance(item, list):
-                    results.append((new_prefix, item))
-                else:
-                    results.extend(JsonFiles.extract_tags_and_values(item, new_prefix))
-        else:
-            results.append((prefix, data))
-        return results
+    def load_json(file_data: str):
+        # Most files are strict JSON, json5 is only needed for comments, trailing commas and the like
+        try:
+            return json.loads(file_data)
+        except ValueError:
+            return json5.loads(file_data)
 
+    @staticmethod
+    def extract_tags_and_values(data: dict, prefix=""):
+        # Yields (tag, value) of every leaf in file order, lists in a dict or a list are leaves
+        stack = [(prefix, data, False)]  # (tag, value, is leaf)
+        while stack:
+            prefix, data, is_leaf = stack.pop()
+            if is_leaf:
+                yield prefix, data
+            elif isinstance(data, dict):
+                stack.extend((f"{prefix}.{key}" if prefix else key, value, isinstance(value, list))
+                             for key, value in reversed(data.items()))
+            elif isinstance(data, list):
+                stack.extend((f"{prefix}[{i}]", data[i], isinstance(data[i], list))
+                             for i in range(len(data) - 1, -1, -1))
+            else:
+                yield prefix, data
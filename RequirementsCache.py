@@ -0,0 +1,81 @@
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import time
+
+
+class RequirementsCache:
+    CACHE_PREFIX = 'requirements_'
+    CACHE_EXT = '.pickle'
+    MAX_AGE_DAYS = 30
+
+    def __init__(self, cache_dir: str):
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @staticmethod
+    def get_key(req_path: str, parameters: list) -> str:
+        # Changes with the content of req.csv, the filter parameters and the code that parses them
+        sha256 = hashlib.sha256()
+        with open(req_path, 'rb') as file:
+            sha256.update(file.read())
+        sha256.update(repr(parameters).encode())
+        sha256.update(RequirementsCache.get_code_version().encode())
+        return sha256.hexdigest()
+
+    @staticmethod
+    def get_code_version() -> str:
+        if getattr(sys, 'frozen', False):  # main.exe, a new build is a new executable
+            stat = os.stat(sys.executable)
+            return f"{sys.executable}:{stat.st_size}:{stat.st_mtime_ns}"
+        sha256 = hashlib.sha256()
+        for source_path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), '*.py'))):
+            with open(source_path, 'rb') as file:
+                sha256.update(file.read())
+        return sha256.hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, RequirementsCache.CACHE_PREFIX + key + RequirementsCache.CACHE_EXT)
+
+    def load(self, key: str):
+        cache_path = self.get_path(key)
+        if not os.path.exists(cache_path):
+            logging.info(f"Requirements are not cached in: {cache_path}")
+            return None
+        try:
+            with open(cache_path, 'rb') as file:
+                requirements = pickle.load(file)
+            os.utime(cache_path)  # Keep entries in use from being removed as old
+            logging.info(f"Requirements loaded from cache: {cache_path}")
+            return requirements
+        except Exception as err:
+            logging.warning(f"Failed to load cached requirements: {cache_path}, err: {err}, type: {type(err)}")
+            return None
+
+    def save(self, key: str, requirements) -> None:
+        if not os.path.exists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        cache_path = self.get_path(key)
+        try:
+            with open(cache_path + '.tmp', 'wb') as file:
+                pickle.dump(requirements, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + '.tmp', cache_path)
+            logging.info(f"Requirements cached in: {cache_path}")
+        except Exception as err:
+            logging.warning(f"Failed to cache requirements: {cache_path}, err: {err}, type: {type(err)}")
+        self.remove_old()
+
+    def remove_old(self) -> None:  # Remove entries of old req.csv versions
+        min_mtime = time.time() - RequirementsCache.MAX_AGE_DAYS * 24 * 60 * 60
+        for cache_path in glob.glob(os.path.join(self._cache_dir, RequirementsCache.CACHE_PREFIX + '*')):
+            try:
+                if os.path.getmtime(cache_path) < min_mtime:
+                    os.remove(cache_path)
+            except Exception as err:
+                logging.warning(f"Failed to remove cached requirements: {cache_path}, err: {err}, type: {type(err)}")
@@ -0,0 +1,125 @@
+import csv
+import logging
+import re
+
+
+class RequirementsTable:
+    # req.csv as columns of Python values, the values of pd.read_csv(path).replace(np.nan, 'None') read with the csv
+    # module. A file pandas could read differently, e.g. a number with spaces around it, is read with pandas
+    NA_VALUES = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                           '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])  # Default na_values
+    NA_VALUE = 'None'
+    BOOL_VALUES = {'True': True, 'TRUE': True, 'true': True, 'False': False, 'FALSE': False, 'false': False}
+    # Numbers that are read the same by int() and float(), up to 15 digits
+    INT_PATTERN = re.compile(r'[+-]?[0-9]{1,15}')
+    FLOAT_PATTERN = re.compile(r'[+-]?(?=\.?[0-9])[0-9]{0,15}\.?[0-9]*(?:[eE][+-]?[0-9]{1,2})?')
+    MAX_FLOAT_DIGITS = 15
+    # Anything pandas may read as a number, a bool or NaN, the rest are always text
+    NOT_TEXT_PATTERN = re.compile(r'\s*(?:[+-]?(?:[0-9.]*(?:[eE][+-]?[0-9]*)?|inf(?:inity)?|nan)|true|false)\s*', re.I)
+
+    def __init__(self, columns: dict):
+        self._columns = columns  # Column name -> list of values, all of the same length
+
+    def __len__(self):
+        return len(next(iter(self._columns.values()), []))
+
+    def __getitem__(self, item):  # List of the values of a column
+        return self._columns[item]
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    @staticmethod
+    def read_csv(path: str):
+        table = RequirementsTable.parse_csv(path)
+        if table is None:
+            logging.info(f"{path} is read with pandas, some of its values are not plain text or numbers")
+            import numpy as np
+            import pandas as pd
+            table = RequirementsTable.from_df(pd.read_csv(path).replace(np.nan, RequirementsTable.NA_VALUE))
+        return table
+
+    @staticmethod
+    def parse_csv(path: str):  # None if pandas could read the file differently
+        with open(path, 'r', encoding='utf-8-sig', newline='') as file:  # pandas drops the BOM too
+            rows = list(filter(None, csv.reader(file)))  # Without blank lines
+        if not rows:
+            return None
+        names = rows[0]
+        if '' in names or len(set(names)) != len(names):  # pandas renames them
+            return None
+        if set(map(len, rows)) != {len(names)}:
+            return None
+        columns = {}
+        for name, values in zip(names, zip(*rows[1:])):
+            columns[name] = RequirementsTable.convert_column(values)
+            if columns[name] is None:
+                return None
+        if len(rows) == 1:
+            columns = {name: [] for name in names}
+        return RequirementsTable(columns)
+
+    @staticmethod
+    def convert_column(values: tuple):
+        # Text as is unless every value is a number or a bool, NaN values are NA_VALUE. None if it is not certain
+        # which type pandas gives the column
+        if RequirementsTable.NA_VALUES.isdisjoint(values):  # Most columns, checked without a loop
+            is_na = None
+            values_no_na = values
+        else:
+            is_na = [value in RequirementsTable.NA_VALUES for value in values]
+            values_no_na = [value for value, value_is_na in zip(values, is_na) if not value_is_na]
+        if not all(map(RequirementsTable.NOT_TEXT_PATTERN.fullmatch, values_no_na)):
+            to_value = str
+        elif all(map(RequirementsTable.INT_PATTERN.fullmatch, values_no_na)):
+            to_value = int if is_na is None else float  # NaN makes it a float column
+        elif all(map(RequirementsTable.is_float, values_no_na)):
+            to_value = float
+        elif all(value in RequirementsTable.BOOL_VALUES for value in values_no_na):
+            to_value = RequirementsTable.BOOL_VALUES.get
+        else:
+            return None
+        if is_na is None:
+            return list(values) if to_value is str else list(map(to_value, values))
+        return [RequirementsTable.NA_VALUE if value_is_na else to_value(value)
+                for value, value_is_na in zip(values, is_na)]
+
+    @staticmethod
+    def is_float(value: str) -> bool:
+        return (RequirementsTable.INT_PATTERN.fullmatch(value) is not None
+                or (RequirementsTable.FLOAT_PATTERN.fullmatch(value) is not None
+                    and sum(char.isdigit() for char in value.split('e')[0].split('E')[0])
+                    <= RequirementsTable.MAX_FLOAT_DIGITS))
+
+    @staticmethod
+    def from_df(df):
+        return RequirementsTable({str(name): df[name].tolist() for name in df.columns})
+
+    def to_df(self):  # pandas is imported only by callers that need a DataFrame
+        import pandas as pd
+        return pd.DataFrame(self._columns, columns=self.columns)
+
+    def take(self, rows: list):  # Table of the given rows
+        return RequirementsTable({name: [values[row] for row in rows] for name, values in self._columns.items()})
+
+    def group_by(self, names) -> dict:
+        # Value of a column, or tuple of values of a list of columns -> table of its rows, in the order of the rows
+        keys = self[names] if isinstance(names, str) else list(zip(*(self[name] for name in names)))
+        rows_by_key = {}
+        for row, key in enumerate(keys):
+            rows_by_key.setdefault(key, []).append(row)
+        return {key: self.take(rows) for key, rows in rows_by_key.items()}
+
+    def get_duplicates(self) -> list:  # Rows equal to an earlier row, as {column: value}
+        seen = set()
+        duplicates = []
+        for row in zip(*self._columns.values()):
+            if row in seen:
+                duplicates.append(dict(zip(self._columns, row)))
+            seen.add(row)
+        return duplicates
@@ -0,0 +1,163 @@
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+
+class ResultsDatabase:
+    # SQLite store of the results of every run, one runs row per run and one key_results row per key of the run
+    DB_NAME = 'results.db'
+    BATCH_SIZE = 10000  # Key rows inserted by one executemany
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY,
+            time TEXT NOT NULL,
+            vendor TEXT NOT NULL,
+            mr_model TEXT NOT NULL,
+            field_strength TEXT NOT NULL,
+            versions TEXT NOT NULL,
+            output_path TEXT
+        );
+        CREATE TABLE IF NOT EXISTS key_results (
+            run_id INTEGER NOT NULL REFERENCES runs (run_id),
+            vendor TEXT NOT NULL,
+            mr_model TEXT NOT NULL,
+            field_strength TEXT NOT NULL,
+            version TEXT NOT NULL,
+            file TEXT NOT NULL,
+            section TEXT,
+            key TEXT,
+            expected TEXT,
+            actual TEXT,
+            status TEXT
+        );
+        CREATE INDEX IF NOT EXISTS key_results_by_key
+            ON key_results (vendor, mr_model, field_strength, version, file, section, key, run_id);
+        CREATE INDEX IF NOT EXISTS key_results_by_run ON key_results (run_id, version, file, section, key);
+        CREATE INDEX IF NOT EXISTS runs_by_parameters ON runs (vendor, mr_model, field_strength, run_id);
+    """
+    RESULT_COLUMNS = ['run_id', 'vendor', 'mr_model', 'field_strength', 'version', 'file', 'section', 'key',
+                      'expected', 'actual', 'status']
+    DIFF_COLUMNS = ['old_version', 'new_version', 'file', 'section', 'key', 'old_expected', 'old_actual', 'old_status',
+                    'new_expected', 'new_actual', 'new_status']
+
+    def __init__(self, db_path: str):
+        self._db_path = db_path
+        if os.path.dirname(db_path) and not os.path.exists(os.path.dirname(db_path)):
+            os.makedirs(os.path.dirname(db_path))
+        self._connection = sqlite3.connect(db_path)
+        self._connection.executescript(ResultsDatabase.SCHEMA)
+
+    @property
+    def db_path(self):
+        return self._db_path
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def add_run(self, vendor: str, mr_model: str, field_strength: str, versions: list, results,
+                output_path: str = None) -> int:
+        # Writes the run and its (file, section, key, expected, actual, status) results, returns the run id
+        keys = 0
+        with self._connection:  # One transaction, a run that fails to be written leaves no rows
+            cursor = self._connection.execute(
+                "INSERT INTO runs (time, vendor, mr_model, field_strength, versions, output_path) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), vendor, mr_model, field_strength, ' '.join(versions),
+                 output_path))
+            run_id = cursor.lastrowid
+            batch = []
+            for file, section, key, expected, actual, status in results:
+                version, file_no_version = ResultsDatabase.split_version(file)
+                batch.append((run_id, vendor, mr_model, field_strength, version, file_no_version, section, key,
+                              ResultsDatabase.to_text(expected), ResultsDatabase.to_text(actual), status))
+                if len(batch) == ResultsDatabase.BATCH_SIZE:
+                    self.insert_results(batch)
+                    keys += len(batch)
+                    batch = []
+            self.insert_results(batch)
+            keys += len(batch)
+        logging.info(f"Run {run_id} with {keys} keys was written to: {self._db_path}")
+        return run_id
+
+    def insert_results(self, batch: list) -> None:
+        self._connection.executemany("INSERT INTO key_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+    @staticmethod
+    def split_version(path: str) -> tuple:  # Fus-7.44\Site\example.ini -> (Fus-7.44, Site\example.ini)
+        version, separator, file = path.partition(os.sep)
+        return version, file
+
+    @staticmethod
+    def to_text(value):  # Same text as in the output CSV, None stays NULL
+        if value is None or type(value) is str:
+            return value
+        return str(value)
+
+    def get_runs(self, vendor: str = None, mr_model: str = None, field_strength: str = None,
+                 limit: int = None) -> list:  # Newest runs first
+        conditions, parameters = ResultsDatabase.get_conditions(vendor=vendor, mr_model=mr_model,
+                                                                field_strength=field_strength)
+        query = "SELECT run_id, time, vendor, mr_model, field_strength, versions, output_path FROM runs" + conditions \
+                + " ORDER BY run_id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        return self._connection.execute(query, parameters).fetchall()
+
+    def get_results(self, run_ids: list = None, vendor: str = None, mr_model: str = None, field_strength: str = None,
+                    version: str = None, file: str = None, section: str = None, key: str = None,
+                    statuses: list = None):
+        # Cursor of the key results matching every given filter, file may hold % and _ wildcards
+        conditions, parameters = ResultsDatabase.get_conditions(vendor=vendor, mr_model=mr_model,
+                                                                field_strength=field_strength, version=version,
+                                                                section=section, key=key)
+        if file is not None:
+            conditions += (" AND" if conditions else " WHERE") + " file LIKE ?"
+            parameters.append(file)
+        for column, values in (('run_id', run_ids), ('status', statuses)):
+            if values:
+                conditions += (" AND" if conditions else " WHERE") + f" {column} IN ({', '.join('?' * len(values))})"
+                parameters.extend(values)
+        return self._connection.execute(f"SELECT {', '.join(ResultsDatabase.RESULT_COLUMNS)} FROM key_results"
+                                        + conditions + " ORDER BY run_id, rowid", parameters)
+
+    def get_diff(self, old_run: int, new_run: int, old_version: str = None, new_version: str = None,
+                 new_statuses: list = None):
+        # Cursor of the keys whose status differs between two runs, also keys found in only one of them. Keys are
+        # matched by version, file, section and key, or by file, section and key between old_version and new_version
+        parameters = {'old_run': old_run, 'new_run': new_run, 'old_version': old_version, 'new_version': new_version}
+        old_condition, new_condition = "old.run_id = :old_run", "new.run_id = :new_run"
+        if old_version is None:
+            on = "new.version = old.version"
+        else:
+            old_condition += " AND old.version = :old_version"
+            new_condition += " AND new.version = :new_version"
+            on = "new.version = :new_version"
+        # Each side is looked up in key_results_by_run, IS also matches keys without a section
+        on = f"{on} AND new.file = old.file AND new.section IS old.section AND new.key IS old.key"
+        status_condition = ""
+        if new_statuses:
+            status_condition = f" AND new.status IN ({', '.join(':status' + str(i) for i in range(len(new_statuses)))})"
+            parameters.update({'status' + str(i): status for i, status in enumerate(new_statuses)})
+        # LEFT JOIN both ways instead of FULL OUTER JOIN, which needs SQLite 3.39
+        query = f"""
+            SELECT old.version, new.version, old.file, old.section, old.key, old.expected, old.actual, old.status,
+                   new.expected, new.actual, new.status
+            FROM key_results AS old LEFT JOIN key_results AS new ON new.run_id = :new_run AND {on}
+            WHERE {old_condition} AND (new.run_id IS NULL OR old.status IS NOT new.status){status_condition}
+            UNION ALL
+            SELECT NULL, new.version, new.file, new.section, new.key, NULL, NULL, NULL, new.expected, new.actual,
+                   new.status
+            FROM key_results AS new
+            WHERE {new_condition}{status_condition}
+                AND NOT EXISTS (SELECT 1 FROM key_results AS old WHERE {old_condition} AND {on})
+            ORDER BY 3, 4, 5"""
+        return self._connection.execute(query, parameters)
+
+    @staticmethod
+    def get_conditions(**filters) -> tuple:  # WHERE clause and parameters of the filters that are not None
+        columns = [column for column, value in filters.items() if value is not None]
+        if not columns:
+            return "", []
+        return " WHERE " + " AND ".join(f"{column} = ?" for column in columns), [filters[column] for column in columns]
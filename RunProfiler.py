@@ -0,0 +1,130 @@
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+
+class RunProfiler:
+    MB = 1024 * 1024
+    TOP_FUNCTIONS = 30
+
+    def __init__(self, enabled: bool = False, profile_validate: bool = False, profile_memory: bool = False):
+        self._enabled = enabled
+        self._profile_validate = profile_validate
+        # tracemalloc slows every stage down, and some much more than others, so it is opt-in. Without it the
+        # stages record the peak RSS of the process
+        self._profile_memory = enabled and profile_memory
+        self._records: list = []
+        self._validate_stats = None
+        if self._profile_memory and not tracemalloc.is_tracing():  # Python allocations only, started once for the run
+            tracemalloc.start()
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @contextlib.contextmanager
+    def stage(self, name: str, version: str = None):
+        # Yields the stage record, the caller may set its 'files' and 'keys' counts
+        record = {'stage': name, 'version': version, 'files': None, 'keys': None}
+        if not self._enabled:
+            yield record
+            return
+        if self._profile_memory:
+            tracemalloc.reset_peak()
+        start_times = os.times()  # Children times cover the --jobs worker processes once they have exited
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        profile = None
+        if self._profile_validate and name == 'validate':
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                if self._validate_stats is None:
+                    self._validate_stats = pstats.Stats(profile)
+                else:
+                    self._validate_stats.add(profile)
+            end_times = os.times()
+            record['wall_s'] = round(time.perf_counter() - start_wall, 4)
+            record['cpu_s'] = round(time.process_time() - start_cpu, 4)
+            record['children_cpu_s'] = round(max(0.0, end_times.children_user + end_times.children_system
+                                                 - start_times.children_user - start_times.children_system), 4)
+            if self._profile_memory:
+                current_memory, peak_memory = tracemalloc.get_traced_memory()
+                record['peak_memory_mb'] = round(peak_memory / RunProfiler.MB, 2)
+                record['memory_mb'] = round(current_memory / RunProfiler.MB, 2)
+            else:  # Highest RSS of the process up to the end of the stage, not only of the stage
+                peak_rss = RunProfiler.get_peak_rss()
+                record['peak_rss_mb'] = None if peak_rss is None else round(peak_rss / RunProfiler.MB, 2)
+            self._records.append(record)
+
+    @staticmethod
+    def get_peak_rss():  # Peak resident set size of this process in bytes, None if it is not available
+        try:
+            if sys.platform == 'win32':
+                import ctypes
+                from ctypes import wintypes
+
+                class ProcessMemoryCounters(ctypes.Structure):
+                    _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                                ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                                ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t),
+                                ('PeakPagefileUsage', ctypes.c_size_t)]
+                counters = ProcessMemoryCounters()
+                counters.cb = ctypes.sizeof(counters)
+                get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+                get_process_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters),
+                                                    wintypes.DWORD]
+                if not get_process_memory_info(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters),
+                                               counters.cb):
+                    return None
+                return counters.PeakWorkingSetSize
+            import resource
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak_rss if sys.platform == 'darwin' else peak_rss * 1024  # Bytes on macOS, KB elsewhere
+        except Exception:
+            return None
+
+    def write_report(self, report_path: str, run_details: dict) -> None:
+        if not self._enabled:
+            return
+        totals = {}
+        for record in self._records:
+            memory_name = 'peak_memory_mb' if self._profile_memory else 'peak_rss_mb'
+            total = totals.setdefault(record['stage'], {'wall_s': 0, 'cpu_s': 0, 'children_cpu_s': 0,
+                                                        memory_name: 0, 'files': 0, 'keys': 0})
+            for name in ('wall_s', 'cpu_s', 'children_cpu_s', 'files', 'keys'):
+                total[name] = round(total[name] + (record[name] or 0), 4)
+            total[memory_name] = max(total[memory_name], record[memory_name] or 0)
+        # Times taken under tracemalloc are slower than in a normal run, and not by the same factor in every stage
+        report = {'run': run_details, 'timed_under_tracemalloc': self._profile_memory, 'totals': totals,
+                  'stages': self._records}
+        if self._validate_stats is not None:
+            profile_path = os.path.splitext(report_path)[0] + '_validate.prof'
+            self._validate_stats.dump_stats(profile_path)
+            report['validate_profile'] = {'path': profile_path, 'top_functions': self.get_top_functions()}
+        with open(report_path, 'w') as file:
+            json.dump(report, file, indent=4)
+
+    def get_top_functions(self) -> list:  # Functions of the validate phase with the highest cumulative time
+        self._validate_stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        top_functions = []
+        for function in self._validate_stats.fcn_list[:RunProfiler.TOP_FUNCTIONS]:
+            primitive_calls, calls, total_time, cumulative_time, callers = self._validate_stats.stats[function]
+            top_functions.append({'function': f"{function[0]}:{function[1]}({function[2]})", 'calls': calls,
+                                  'tottime_s': round(total_time, 4), 'cumtime_s': round(cumulative_time, 4)})
+        return top_functions
+
+    def reset(self) -> None:  # Start the records of the next run of a batch
+        self._records = []
+        self._validate_stats = None
@@ -0,0 +1,49 @@
+import os
+
+
+class SkipIndex:
+    # filesToSkip.json compiled once: file path -> section -> skipped keys, as sets for validation and as prefix tuples
+    # for setting default values
+
+    def __init__(self, files_to_skip: dict):
+        self._keys: dict = {}
+        self._prefixes: dict = {}
+        for path, sections in files_to_skip.items():
+            path = os.path.normpath(path)  # Same separators as the paths of os.walk
+            self._keys[path] = SkipIndex.compile_keys(sections)
+            self._prefixes[path] = SkipIndex.compile_prefixes(sections)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get_keys(self, path: str):  # {section: frozenset(keys)} of a path relative to the version folder, or None
+        return self._keys.get(path)
+
+    def get_prefixes(self, path: str):  # {section: tuple(keys)} for str.startswith, or None
+        return self._prefixes.get(path)
+
+    @staticmethod
+    def compile_keys(sections):
+        if not isinstance(sections, dict):  # Kept as is, fails the same way when used
+            return sections
+        keys_by_section = {}
+        for section, keys in sections.items():
+            if isinstance(keys, (list, tuple, set, dict)):  # 'key in' a string matches substrings, keep strings
+                try:
+                    keys = frozenset(keys)
+                except TypeError:
+                    pass
+            keys_by_section[section] = keys
+        return keys_by_section
+
+    @staticmethod
+    def compile_prefixes(sections):
+        if not isinstance(sections, dict):
+            return sections
+        prefixes = {}
+        for section, keys in sections.items():
+            try:
+                prefixes[section] = tuple(keys)  # Same tuple line.startswith() was given for every line
+            except TypeError:
+                prefixes[section] = keys
+        return prefixes
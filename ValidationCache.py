@@ -0,0 +1,97 @@
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import time
+from RequirementsCache import RequirementsCache
+
+
+class ValidationCache:
+    # Validation results of every file of the last run of a parameter set, with the content hash of the file and its
+    # requirement rows they were validated with
+    CACHE_PREFIX = 'validation_'
+    CACHE_EXT = '.pickle'
+    MAX_AGE_DAYS = 30
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, cache_dir: str, key: str):
+        self._cache_dir = cache_dir
+        self._key = key
+        self._old_files: dict = {}  # path_no_root -> (file key, result rows) of the last run
+        self._files: dict = {}  # Same for this run, saved for the next one
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @staticmethod
+    def get_key(parameters: list, files_to_skip_path: str) -> str:
+        # Changes with the parameters, filesToSkip.json and the code that validates
+        sha256 = hashlib.sha256()
+        sha256.update(repr(parameters).encode())
+        if os.path.exists(files_to_skip_path):
+            with open(files_to_skip_path, 'rb') as file:
+                sha256.update(file.read())
+        sha256.update(RequirementsCache.get_code_version().encode())
+        return sha256.hexdigest()
+
+    @staticmethod
+    def get_file_key(path: str, requirements: list):  # Hash of the content and requirement rows, None if unreadable
+        sha256 = hashlib.sha256()
+        try:
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(ValidationCache.CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+        except OSError:  # Validated again, fails the same way as in a full run
+            return None
+        sha256.update(repr(requirements).encode())
+        return sha256.hexdigest()
+
+    def get_path(self) -> str:
+        return os.path.join(self._cache_dir, ValidationCache.CACHE_PREFIX + self._key + ValidationCache.CACHE_EXT)
+
+    def get(self, path_no_root: str, file_key: str):  # Result rows of the last run, None if the file changed
+        entry = self._old_files.get(path_no_root)
+        if file_key is None or entry is None or entry[0] != file_key:
+            return None
+        return entry[1]
+
+    def set(self, path_no_root: str, file_key: str, rows: list) -> None:
+        self._files[path_no_root] = (file_key, rows)
+
+    def load(self) -> None:
+        cache_path = self.get_path()
+        if not os.path.exists(cache_path):
+            logging.info(f"Validation results are not cached in: {cache_path}")
+            return
+        try:
+            with open(cache_path, 'rb') as file:
+                self._old_files = pickle.load(file)
+            logging.info(f"Validation results of {len(self._old_files)} files loaded from cache: {cache_path}")
+        except Exception as err:
+            logging.warning(f"Failed to load cached validation results: {cache_path}, err: {err}, type: {type(err)}")
+            self._old_files = {}
+
+    def save(self) -> None:  # Keeps only the files of this run
+        if not os.path.exists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        cache_path = self.get_path()
+        try:
+            with open(cache_path + '.tmp', 'wb') as file:
+                pickle.dump(self._files, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + '.tmp', cache_path)
+            logging.info(f"Validation results of {len(self._files)} files cached in: {cache_path}")
+        except Exception as err:
+            logging.warning(f"Failed to cache validation results: {cache_path}, err: {err}, type: {type(err)}")
+        self.remove_old()
+
+    def remove_old(self) -> None:  # Remove entries of parameter sets that were not run for a while
+        min_mtime = time.time() - ValidationCache.MAX_AGE_DAYS * 24 * 60 * 60
+        for cache_path in glob.glob(os.path.join(self._cache_dir, ValidationCache.CACHE_PREFIX + '*')):
+            try:
+                if os.path.getmtime(cache_path) < min_mtime:
+                    os.remove(cache_path)
+            except Exception as err:
+                logging.warning(f"Failed to remove cached validation results: {cache_path}, err: {err}, "
+                                f"type: {type(err)}")
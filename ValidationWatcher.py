@@ -0,0 +1,99 @@
+import logging
+import threading
+from Requirements import Requirements
+from SkipIndex import SkipIndex
+
+
+class ValidationWatcher:
+    # Validates the versions in a background thread while XCom runs, then again only the files XCom changed
+    FILES_PER_CHUNK = 100  # Files compared together, stop() waits for the chunk in progress
+
+    def __init__(self, requirements: Requirements, manifests: list, skip_index: SkipIndex, interval: float = 2.0):
+        self._requirements = requirements
+        self._manifests = manifests
+        self._skip_index = skip_index
+        self._interval = interval
+        self._validated: dict = {}  # Path -> ((mtime_ns, size) of the content its results are of, file)
+        self._last_seen: dict = {}  # Path -> (mtime_ns, size) of the previous poll, a file is validated once stable
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name='ValidationWatcher', daemon=True)
+        self._changed = 0
+
+    def start(self):
+        self._last_seen = {curr_path: stat for (curr_path, *_), stat in self.list_files()}
+        version_paths = [manifest.version_path for manifest in self._manifests]
+        logging.info(f"Watching {len(self._last_seen)} files in: {version_paths}")
+        self._thread.start()
+
+    def stop(self) -> tuple:
+        # Validates the files that are not validated in their current state, returns their number of files and keys
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        files = self.list_files()
+        files_to_validate = [file for file, stat in files if self.get_validated_stat(file[0]) != stat]
+        for path in self._validated.keys() - {file[0] for file, stat in files}:  # Removed while XCom ran
+            curr_path, path_no_root, extension, sections_to_skip = self._validated[path][1]
+            self._requirements.reset_file(path_no_root, extension)
+        logging.info(f"Watch validated {len(files) - len(files_to_validate)} of {len(files)} files before the "
+                     f"confirmation, {self._changed} of them after XCom changed them")
+        validated_files, keys = self._requirements.revalidate_files(files_to_validate)
+        self._requirements.sort_files([path_no_root for (curr_path, path_no_root, *_), stat in files])
+        return validated_files, keys
+
+    def cancel(self):  # Stops the polling without validating, e.g. when the run failed
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as err:
+                logging.warning(f"Failed to validate changed files, err: {err}, type: {type(err)}")
+            self._stop.wait(self._interval)
+
+    def poll(self):
+        files = self.list_files()
+        files_to_validate = []
+        for file, stat in files:
+            if self._stop.is_set():
+                return
+            # Files XCom is still writing are validated on a later poll
+            if self.get_validated_stat(file[0]) != stat and self._last_seen.get(file[0]) == stat:
+                files_to_validate.append((file, stat))
+        self._last_seen = {file[0]: stat for file, stat in files}
+        for i in range(0, len(files_to_validate), ValidationWatcher.FILES_PER_CHUNK):
+            if self._stop.is_set():
+                return
+            chunk = files_to_validate[i:i + ValidationWatcher.FILES_PER_CHUNK]
+            try:
+                self._requirements.revalidate_files([file for file, stat in chunk])
+            except Exception as err:  # E.g. removed by XCom since the walk, stop() validates them again
+                logging.warning(f"Failed to validate changed files, err: {err}, type: {type(err)}")
+                for file, stat in chunk:
+                    self._requirements.reset_file(file[1], file[2])
+                    self._validated.pop(file[0], None)
+                continue
+            for file, stat in chunk:
+                if file[0] in self._validated:
+                    self._changed += 1
+                self._validated[file[0]] = (stat, file)
+        if files_to_validate:
+            print(f"Watch: validated {len(files_to_validate)} files, {len(self._validated)} of {len(files)} files "
+                  f"were validated")
+
+    def get_validated_stat(self, path: str):
+        return self._validated[path][0] if path in self._validated else None
+
+    def list_files(self) -> list:  # [((curr_path, path_no_root, extension, sections_to_skip), (mtime_ns, size))]
+        files = []
+        for manifest in self._manifests:
+            manifest.refresh()  # Lists again only the folders XCom added or removed files in
+            stats = {path: (mtime_ns, size) for path, rel_path, extension, size, mtime_ns in manifest.get_files()}
+            for file in Requirements.list_files(manifest, self._skip_index):
+                if stats[file[0]][0] is None:  # Removed by XCom since the listing
+                    continue
+                files.append((file, stats[file[0]]))
+        return files
@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import sys
+from multiprocessing.connection import Client
+
+KEY_FILE = 'xpert_server.json'  # Written by main.py --serve, same as XpertServer.KEY_FILE
+
+
+def define_inputs(argv: list = None) -> argparse.Namespace:
+    # Imports nothing of XPERT, the run starts without loading pandas in this process
+    parser = argparse.ArgumentParser(description="Run XPERT in the resident process started with main.py --serve")
+    parser.add_argument("-v", "--vendor", required=False, help="The name of the MRI vendor")
+    parser.add_argument("-m", "--mr_model", required=False, help="The model of the MRI")
+    parser.add_argument("-f", "--field", required=False, help="The strength of the magnetic field")
+    parser.add_argument("--versions", nargs="+", required=False, help="All fus versions")
+    parser.add_argument("-w", "--work_dir", required=False,
+                        help="-w of the server, default is the folder of the script")
+    parser.add_argument("--stop", action="store_true", help="Stop the server after its current run")
+    arguments = parser.parse_args(argv)
+    if not arguments.stop and None in (arguments.vendor, arguments.mr_model, arguments.field, arguments.versions):
+        parser.error("-v, -m, -f and --versions are required without --stop")
+    return arguments
+
+
+def connect(work_dir: str):
+    key_path = os.path.join(work_dir, KEY_FILE)
+    if not os.path.exists(key_path):
+        raise Exception(f"No XPERT server is running for {work_dir}, start it with main.py --serve")
+    with open(key_path, 'r') as file:
+        server = json.load(file)
+    return Client(('127.0.0.1', server['port']), authkey=bytes.fromhex(server['authkey']))
+
+
+def run(connection, arguments: argparse.Namespace):  # Returns the output CSV path
+    if arguments.stop:
+        connection.send({'command': 'stop'})
+    else:
+        connection.send({'command': 'run', 'vendor': arguments.vendor, 'mr_model': arguments.mr_model,
+                         'field': arguments.field, 'versions': arguments.versions})
+    while True:
+        kind, value = connection.recv()
+        match kind:
+            case 'prompt':  # The server waits for XCom
+                connection.send(input(value))
+            case 'done':
+                return value
+            case 'error':
+                raise Exception(value)
+
+
+if __name__ == "__main__":
+    args = define_inputs()
+    with connect(args.work_dir or os.path.dirname(os.path.realpath(__file__))) as server_connection:
+        try:
+            output_path = run(server_connection, args)
+        except Exception as err:
+            print(f"The Run failed: {err}")
+            sys.exit(1)
+    if output_path is not None:
+        print(f"Output is in: {output_path}")
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import secrets
+from multiprocessing.connection import Listener
+
+
+class XpertServer:
+    # Local socket of the resident XPERT process. The port and the key clients authenticate with are written to
+    # KEY_FILE in the work folder, readable only by its owner on POSIX. On Windows the file gets the access of the work
+    # folder, keep the work folder private: a client with the key sends pickles the server loads
+    KEY_FILE = 'xpert_server.json'
+    HOST = '127.0.0.1'
+    RUN_PARAMETERS = ('vendor', 'mr_model', 'field')
+
+    def __init__(self, work_dir: str, port: int = 0):
+        self._key_path = os.path.join(work_dir, XpertServer.KEY_FILE)
+        self._authkey = secrets.token_bytes(32)
+        self._listener = Listener((XpertServer.HOST, port), authkey=self._authkey)
+
+    @property
+    def port(self):
+        return self._listener.address[1]
+
+    def start(self) -> None:
+        if os.path.exists(self._key_path + '.tmp'):  # Left by a server that was killed, its mode is not ours
+            os.remove(self._key_path + '.tmp')
+        with os.fdopen(os.open(self._key_path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as file:
+            json.dump({'port': self.port, 'authkey': self._authkey.hex(), 'pid': os.getpid()}, file)
+        os.replace(self._key_path + '.tmp', self._key_path)
+        logging.info(f"Listening on {XpertServer.HOST}:{self.port}, key file: {self._key_path}")
+
+    def stop(self) -> None:
+        self._listener.close()
+        try:
+            os.remove(self._key_path)
+        except FileNotFoundError:
+            pass
+
+    def requests(self):  # (connection, request) of every client, one at a time, until a stop request
+        while True:
+            try:
+                connection = self._listener.accept()
+            except Exception as err:  # E.g. a client with a wrong key
+                logging.warning(f"Failed to accept a client, err: {err}, type: {type(err)}")
+                continue
+            try:
+                request = connection.recv()
+            except Exception as err:
+                logging.warning(f"Failed to read a request, err: {err}, type: {type(err)}")
+                connection.close()
+                continue
+            if not isinstance(request, dict):
+                XpertServer.reply(connection, 'error', f"A request is a dict with a 'command', got: {type(request)}")
+                connection.close()
+                continue
+            if request.get('command') == 'stop':
+                XpertServer.reply(connection, 'done', None)
+                connection.close()
+                return
+            try:
+                yield connection, request
+            finally:
+                connection.close()
+
+    @staticmethod
+    def get_run_parameters(request: dict) -> tuple:  # vendor, MR model, field and versions of a run request
+        if request.get('command') != 'run':
+            raise ValueError(f"Unknown command: {request.get('command')}")
+        for name in XpertServer.RUN_PARAMETERS:
+            if not isinstance(request.get(name), str):
+                raise ValueError(f"A run request needs '{name}' as a string")
+        versions = request.get('versions')
+        if not isinstance(versions, (list, tuple)) or not versions or not all(isinstance(version, str)
+                                                                              for version in versions):
+            raise ValueError("A run request needs 'versions' as a list of strings")
+        return request['vendor'], request['mr_model'], request['field'], list(versions)
+
+    @staticmethod
+    def ask(connection, prompt: str) -> str:  # Shows the prompt in the client and returns the answer of the user
+        connection.send(('prompt', prompt))
+        return connection.recv()
+
+    @staticmethod
+    def reply(connection, kind: str, value) -> None:  # kind is 'done' with the output CSV path, or 'error'
+        try:
+            connection.send((kind, value))
+        except Exception as err:  # The client is gone, the run itself is complete
+            logging.warning(f"Failed to reply to the client, err: {err}, type: {type(err)}")
@@ -1,25 +1,50 @@
+import atexit
 import logging
 from datetime import datetime
 from Backup import Backup
 from Requirements import Requirements
 import argparse
-import pandas as pd
+import csv
 import os
-import numpy as np
+from collections import OrderedDict
+import multiprocessing
 import json5 as json
 from DefaultValue import DefaultValue
-
-
-def define_log() -> None:  # Log settings
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    log_path = os.path.join(script_dir, 'Logs')
+from FileManifest import FileManifest
+from IniReader import IniReader
+from LogQueueHandler import LogQueueHandler
+from RequirementsCache import RequirementsCache
+from RequirementsTable import RequirementsTable
+from ResultsDatabase import ResultsDatabase
+from RunProfiler import RunProfiler
+from SkipIndex import SkipIndex
+from ValidationCache import ValidationCache
+from ValidationWatcher import ValidationWatcher
+from XpertServer import XpertServer
+
+
+def define_log(work_dir: str, log_level: str = 'DEBUG') -> dict:  # Log settings, also used by worker processes
+    log_path = os.path.join(work_dir, 'Logs')
     if not os.path.exists(log_path):
         os.makedirs(log_path)
-    logging.basicConfig(level=logging.DEBUG,
-                        filename=os.path.join(log_path, f"log_{datetime.now().strftime('%m-%d_%H-%M')}.log"),
-                        filemode='w',
-                        format="%(asctime)s - %(funcName)20s() - %(levelname)s - %("
-                               "message)s")
+    log_config = {'level': logging.getLevelName(log_level),
+                  'filename': os.path.join(log_path, f"log_{datetime.now().strftime('%m-%d_%H-%M')}.log"),
+                  'format': "%(asctime)s - %(funcName)20s() - %(levelname)s - %(message)s"}
+    open(log_config['filename'], 'w').close()
+    # Append mode, worker processes of --jobs write to the same file
+    file_handler = logging.FileHandler(log_config['filename'], mode='a')
+    file_handler.setFormatter(logging.Formatter(log_config['format']))
+    queue_handler = LogQueueHandler(file_handler)  # The file is written by a background thread
+    queue_handler.start()
+    atexit.register(queue_handler.stop)
+    logging.basicConfig(level=log_config['level'], handlers=[queue_handler])
+    return log_config
+
+
+def get_work_dir() -> str:  # Folder of Logs, Backup, Cache and Results
+    if args.work_dir is not None:
+        return args.work_dir
+    return os.path.dirname(os.path.realpath(__file__))
 
 
 def get_files_to_skip(path: str) -> dict:  # Get all skipped files from a given path of an external file
@@ -33,17 +58,17 @@ def get_files_to_skip(path: str) -> dict:  # Get all skipped files from a given
 
 
 def check_versions_exist(versions: list) -> None:  # Verify given versions exist in dest
-    dest = "D:\\FusWs"
+    dest = args.root
     curr_versions = os.listdir(dest)
     for version in versions:
         curr_version = [s for s in curr_versions if version in s]
         if not curr_version:  # Version is not found in dest
             logging.error(f"{version} does not exist in {dest}")
-            raise Exception("Not all versions to check, exist in D:\\FusWs, check log file")
+            raise Exception(f"Not all versions to check, exist in {dest}, check log file")
 
 
 def rename_versions(versions_to_check: list) -> None:  # Rename versions in dest directory
-    dest = "D:\\FusWs"
+    dest = args.root
     versions_in_dir = os.listdir(dest)
     for version in versions_to_check:
         curr_version = [s for s in versions_in_dir if version+"_" in s]
@@ -53,14 +78,9 @@ def rename_versions(versions_to_check: list) -> None:  # Rename versions in dest
 
 
 def read_inputs(arguments: argparse.Namespace) -> tuple:
-    req_path: str = arguments.input_csv
-    logging.info(f"Req file taken from: {req_path}")
-    if not os.path.exists(req_path):
-        logging.error(f"Requirements path does not exist")
-        raise Exception(f"Requirements path does not exist")
     files_to_skip_path: str = arguments.input_not_null
     logging.info(f"Files to skip was taken from: {files_to_skip_path}")
-    files_to_skip_data: dict = get_files_to_skip(files_to_skip_path)
+    skip_index: SkipIndex = SkipIndex(get_files_to_skip(files_to_skip_path))  # Compiled once for every stage
     vendor: str = arguments.vendor
     logging.info(f"Vendor name is: {vendor}")
     mr_model: str = arguments.mr_model
@@ -70,64 +90,183 @@ def read_inputs(arguments: argparse.Namespace) -> tuple:
     ls_fus_versions: list[str] = arguments.versions
     logging.info(f"Selected FUS: {ls_fus_versions}")
     backup_option: str = arguments.backup
-    df_req: pd.DataFrame = pd.read_csv(req_path)
-    df_req = df_req.replace(np.nan, 'None')
+    check_versions_exist(ls_fus_versions)
+    return skip_index, vendor, mr_model, field_strength, ls_fus_versions, backup_option
+
+
+def read_requirements(req_path: str) -> RequirementsTable:
+    logging.info(f"Req file taken from: {req_path}")
+    if not os.path.exists(req_path):
+        logging.error(f"Requirements path does not exist")
+        raise Exception(f"Requirements path does not exist")
+    df_req: RequirementsTable = RequirementsTable.read_csv(req_path)  # Without pandas, NaN values are 'None'
     verify_col_names(df_req)
     check_duplications(df_req)
-    check_versions_exist(ls_fus_versions)
-    return df_req, files_to_skip_data, vendor, mr_model, field_strength, ls_fus_versions, backup_option
+    return df_req
+
+
+def read_input_list(input_list_path: str) -> list:  # Rows of input.csv: vendor, MR model, field strength, versions
+    logging.info(f"Input list taken from: {input_list_path}")
+    if not os.path.exists(input_list_path):
+        logging.error(f"Input list path does not exist")
+        raise Exception(f"Input list path does not exist")
+    with open(input_list_path, 'r', encoding='utf-8-sig', newline='') as file:
+        rows = list(csv.reader(file))[1:]  # Skip header like ExecuteXPERT.bat
+    return [(row[0], row[1], row[2], row[3].split()) for row in rows if len(row) >= 4]
+
+
+def index_req(df_req: RequirementsTable) -> dict:  # Requirements of each (Vendor, MR, FieldStrength)
+    return df_req.group_by(['Vendor', 'MR', 'FieldStrength'])
+
+
+def get_req() -> RequirementsTable:  # Requirements of the current vendor, model and field, req.csv is read once
+    global df_req, req_index
+    if req_index is None:
+        df_req = read_requirements(args.input_csv)
+        req_index = index_req(df_req)
+    return req_index.get((vendor, mr_model, field_strength), df_req.take([]))
+
+
+def load_req() -> Requirements:  # Parsed requirements from the cache, or filtered and parsed from req.csv
+    global df_filtered
+    cache: RequirementsCache = RequirementsCache(os.path.join(get_work_dir(), "Cache"))
+    cache_key = None
+    if not args.no_req_cache and os.path.exists(args.input_csv):
+        cache_key = RequirementsCache.get_key(args.input_csv, [vendor, mr_model, field_strength, ls_fus_versions,
+                                                                args.ini_parser])
+        with profiler.stage('load_req_cache'):
+            requirements = cache.load(cache_key)
+        if requirements is not None:
+            print("Loaded parsed requirements from cache")
+            return requirements
+    with profiler.stage('filter_req') as stage:
+        df_filtered = filter_req(get_req())
+        stage['keys'] = len(df_filtered)
+    with profiler.stage('parse_req') as stage:
+        requirements = parse_req()
+        stage['keys'] = len(df_filtered)
+    if cache_key is not None:
+        cache.save(cache_key, requirements)
+    return requirements
 
 
 def verify_col_names(df_req) -> None:
     df_req_col_names = {'Vendor', 'MR', 'FieldStrength', 'path', 'section', 'ini key', 'value',
                         'added/updated in Xcom Version'}
-    if not df_req_col_names.issubset(df_req.columns.str.strip()):  # Verify col names are valid
+    if not df_req_col_names.issubset(col_name.strip() for col_name in df_req.columns):  # Verify col names are valid
         logging.error("Invalid columns names in requirements file")
         raise Exception("Invalid columns names in requirements file")
 
 
-def define_inputs() -> argparse.Namespace:
+def define_inputs(argv: list = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Process data with specified options")
     parser.add_argument("-i", "--input_csv", required=True, help="The input file of requirements as CSV")
-    parser.add_argument("-v", "--vendor", required=True, help="The name of the MRI vendor")
-    parser.add_argument("-m", "--mr_model", required=True, help="The model of the MRI")
-    parser.add_argument("-f", "--field", required=True, help="The strength of the magnetic field")
+    parser.add_argument("-v", "--vendor", required=False, help="The name of the MRI vendor")
+    parser.add_argument("-m", "--mr_model", required=False, help="The model of the MRI")
+    parser.add_argument("-f", "--field", required=False, help="The strength of the magnetic field")
     parser.add_argument("-n", "--input_not_null", required=True,
                         help="The input file that contains file to ignore when "
                              "setting null values")
-    parser.add_argument("--versions", nargs="+", required=True, help="All fus versions")
+    parser.add_argument("--versions", nargs="+", required=False, help="All fus versions")
+    parser.add_argument("-l", "--input_list", required=False,
+                        help="input.csv with vendor, MR model, field strength and versions per row, runs every row "
+                             "with the requirements loaded once instead of -v, -m, -f and --versions")
+    parser.add_argument("-r", "--root", required=False, default="D:\\FusWs",
+                        help="The folder that holds the FUS versions")
+    parser.add_argument("-w", "--work_dir", required=False,
+                        help="Folder for Logs, Backup, Cache and Results, default is the folder of the script")
     parser.add_argument("-b", "--backup", required=False, help="Backup files before execution")
-    arguments = parser.parse_args()
+    parser.add_argument("--backup_archive", action="store_true",
+                        help="Backup every version into one zip in the Backup folder instead of a folder of copies, "
+                             "restore extracts only the files that changed")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of workers used to set default values and validate the versions, "
+                             "1 runs serially")
+    parser.add_argument("--no_req_cache", action="store_true",
+                        help="Always parse req.csv instead of loading the parsed requirements from the Cache folder")
+    parser.add_argument("--log_level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="DEBUG",
+                        help="Lowest level written to the log file, WARNING skips the per-key logs")
+    parser.add_argument("--ini_parser", choices=IniReader.PARSERS, default=IniReader.PARSER_XPERT,
+                        help="INI parser used in validation, 'compare' logs differences from pyiniconfig")
+    parser.add_argument("--watch", action="store_true",
+                        help="Validate files while XCom changes them, after the ok only files that changed since "
+                             "they were validated are validated")
+    parser.add_argument("--watch_interval", type=float, default=2.0,
+                        help="Seconds between the checks for changed files of --watch")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write time, memory, file and key counts of every stage to a JSON report in Results")
+    parser.add_argument("--profile_validate", action="store_true",
+                        help="With --profile, also save cProfile stats of the validation next to the report")
+    parser.add_argument("--profile_memory", action="store_true",
+                        help="With --profile, record the peak Python memory of every stage with tracemalloc instead "
+                             "of the peak RSS of the process, the stages run slower and their times are marked")
+    parser.add_argument("--results_db", action="store_true",
+                        help="Also write the results of every run to Results\\results.db, see QueryResults.py")
+    parser.add_argument("--read_threads", type=int, default=0,
+                        help="With --jobs 1, threads that read and parse the next files while the keys of the "
+                             "current file are checked, 0 reads and checks file by file")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse the validation results of the last run with the same vendor, model, field and "
+                             "versions for files whose content and requirement rows did not change")
+    parser.add_argument("--serve", action="store_true",
+                        help="Stay running and validate the runs sent by XpertClient.py, req.csv, filesToSkip.json "
+                             "and parsed files are read again only when they change")
+    parser.add_argument("--port", type=int, default=0,
+                        help="Local port of --serve, 0 picks a free one, clients find it in the work folder")
+    arguments = parser.parse_args(argv)
+    if arguments.incremental and arguments.watch:
+        parser.error("--incremental is not used with --watch, which validates only changed files already")
+    if arguments.input_list is None and not arguments.serve and None in (arguments.vendor, arguments.mr_model,
+                                                                          arguments.field, arguments.versions):
+        parser.error("-v, -m, -f and --versions are required without --input_list or --serve")
     return arguments
 
 
 def check_duplications(df_req) -> None:
-    if df_req.duplicated().any():  # Check for duplications in req file
-        logging.error(f"There are duplications in requirement file: {df_req[df_req.duplicated()]}")
+    duplications = df_req.get_duplicates()
+    if duplications:  # Check for duplications in req file
+        logging.error(f"There are duplications in requirement file: {duplications}")
         raise Exception("There are duplications in requirement file")
 
 
-def filter_req(df_req: pd.DataFrame) -> pd.DataFrame:  # Filtering req file according to input parameters
-    df_filtered = df_req[(df_req['Vendor'] == vendor) & (df_req['MR'] == mr_model)
-                         & (df_req['FieldStrength'] == field_strength)
-                         & (df_req['path'].apply(lambda x: any(s + '\\' in x for s in ls_fus_versions)))]
-    #.str.contains('|'.join(ls_fus_versions)))
+def filter_req(df_req: RequirementsTable) -> RequirementsTable:  # Filtering req file according to input parameters
+    version_folders = tuple(version + os.sep for version in ls_fus_versions)
+    in_versions = {}  # path -> whether it is in one of the versions, checked once for all the keys of the file
+    rows = []
+    for row, (row_vendor, row_mr_model, row_field_strength, path) in enumerate(zip(
+            df_req['Vendor'], df_req['MR'], df_req['FieldStrength'], df_req['path'])):
+        if row_vendor == vendor and row_mr_model == mr_model and row_field_strength == field_strength:
+            if path not in in_versions:
+                in_versions[path] = any(version_folder in path for version_folder in version_folders)
+            if in_versions[path]:
+                rows.append(row)
+    df_filtered = df_req.take(rows)
     if df_filtered.empty:
         logging.error(f"Requirements are not found for {vendor}, {mr_model}, {field_strength}, {ls_fus_versions}")
         raise Exception(f"Requirements are not found for {vendor}, {mr_model}, {field_strength}, {ls_fus_versions}")
     return df_filtered
 
 
+def scan_versions(ls_fus_versions: list) -> dict:  # Walk every version once, the later stages use its files
+    manifests = {}
+    for fus_folder in ls_fus_versions:
+        logging.info(f"Start to list the files of: {fus_folder}")
+        manifests[fus_folder] = FileManifest(os.path.join(args.root, fus_folder))
+        with profiler.stage('scan', fus_folder) as stage:
+            stage['files'] = manifests[fus_folder].scan()
+    return manifests
+
+
 def backup_versions() -> Backup:  # Backup FUS versions from src dir to a given dest dir
-    script_dir: str = os.path.dirname(os.path.realpath(__file__))
     print("Start backup")
-    dest_dir = os.path.join(script_dir, "Backup")
-    src_dir = "D:\\FusWs"
-    backup: Backup = Backup(src_dir, dest_dir)
+    dest_dir = os.path.join(get_work_dir(), "Backup")
+    src_dir = args.root
+    backup: Backup = Backup(src_dir, dest_dir, args.backup_archive)
     logging.info(f"Start to backup from: {src_dir} to {dest_dir}")
     for fus_folder in ls_fus_versions:  # Iterating specific FUS versions and backup each version to src_dir
         logging.info(f"Start to backup {fus_folder}")
-        backup.backup_version(fus_folder)
+        with profiler.stage('backup', fus_folder) as stage:
+            stage['files'] = backup.backup_version(fus_folder, manifests[fus_folder])
     print("Finished backup")
     logging.info("Backup is completed")
     return backup
@@ -136,7 +275,7 @@ def backup_versions() -> Backup:  # Backup FUS versions from src dir to a given
 def parse_req() -> Requirements:  # Parse requirements into structured data
     logging.info("Start parsing")
     print("Start parsing")
-    requirements: Requirements = Requirements(mr_model, field_strength, vendor, df_filtered)
+    requirements: Requirements = Requirements(mr_model, field_strength, vendor, df_filtered, args.ini_parser)
     print("Finished parsing")
     logging.info("Parsing is completed")
     return requirements
@@ -146,47 +285,106 @@ def set_default_values(ls_fus_versions: list) -> None:  # Set default values to
     for fus_folder in ls_fus_versions:
         print(f"Start setting default values for {fus_folder}")
         logging.info(f"Start to set default values to: {fus_folder}")
-        DefaultValue.set_default_values_in_folder(os.path.join("D:\\FusWs", fus_folder), files_to_skip_data)
+        with profiler.stage('set_default_values', fus_folder) as stage:
+            stage['files'], stage['written'] = DefaultValue.set_default_values_in_folder(manifests[fus_folder],
+                                                                                         skip_index, args.jobs)
         print(f"Finished setting default values for {fus_folder}")
     print("Finished setting default values")
     logging.info("Set default values is completed")
 
 
+def load_validation_cache(ls_fus_versions: list) -> ValidationCache:  # Results of the last run of these parameters
+    cache: ValidationCache = ValidationCache(os.path.join(get_work_dir(), "Cache"), ValidationCache.get_key(
+        [vendor, mr_model, field_strength, ls_fus_versions, args.ini_parser], args.input_not_null))
+    with profiler.stage('load_validation_cache'):
+        cache.load()
+    return cache
+
+
 def validate_versions(ls_fus_versions: list) -> None:  # Validate after XCom run
-    for fus_folder in ls_fus_versions:
-        print(f"Start validating {fus_folder}")
-        logging.info(f"Start to validate folder: {fus_folder}")
-        requirements.validate(os.path.join("D:\\FusWs", fus_folder), files_to_skip_data)
-        print(f"Finished validating {fus_folder}")
-        logging.info(f"Finished validating: {fus_folder}")
+    cache = load_validation_cache(ls_fus_versions) if args.incremental else None
+    if args.jobs > 1:
+        print(f"Start validating {ls_fus_versions} with {args.jobs} jobs")
+        logging.info(f"Start to validate folders: {ls_fus_versions} with {args.jobs} jobs")
+        with profiler.stage('validate') as stage:  # Versions are validated together by the workers
+            for fus_folder in ls_fus_versions:  # Files added or removed by XCom
+                manifests[fus_folder].refresh()
+            stage['files'], stage['keys'] = requirements.validate_parallel(
+                [manifests[fus_folder] for fus_folder in ls_fus_versions], skip_index, args.jobs, log_config, cache)
+    else:
+        for fus_folder in ls_fus_versions:
+            print(f"Start validating {fus_folder}")
+            logging.info(f"Start to validate folder: {fus_folder}")
+            with profiler.stage('validate', fus_folder) as stage:
+                manifests[fus_folder].refresh()  # Files added or removed by XCom
+                stage['files'], stage['keys'] = requirements.validate(manifests[fus_folder], skip_index, cache,
+                                                                      args.read_threads)
+                if args.read_threads > 0:
+                    stage['pipeline'] = requirements.pipeline_metrics
+            print(f"Finished validating {fus_folder}")
+            logging.info(f"Finished validating: {fus_folder}")
+    if cache is not None:
+        cache.save()
     print("Finish validation")
 
 
-def create_output(requirements: Requirements, ls_fus_versions: list) -> None:
-    script_dir: str = os.path.dirname(os.path.realpath(__file__))
+def start_watch(ls_fus_versions: list) -> ValidationWatcher:  # Validate in the background while XCom runs
+    print(f"Watching {ls_fus_versions} for files changed by XCom")
+    logging.info(f"Start to watch folders: {ls_fus_versions}")
+    watcher: ValidationWatcher = ValidationWatcher(requirements, [manifests[fus_folder] for fus_folder
+                                                                  in ls_fus_versions], skip_index, args.watch_interval)
+    watcher.start()
+    return watcher
+
+
+def finish_watch(watcher: ValidationWatcher) -> None:  # Validate the files not validated in their final state
+    print("Start validating files changed since they were watched")
+    with profiler.stage('validate') as stage:
+        stage['files'], stage['keys'] = watcher.stop()
+    print("Finish validation")
+
+
+def create_output(requirements: Requirements, ls_fus_versions: list) -> str:
     print("Start outputting")
     logging.info("Start outputting")
-    requirements.output(script_dir, ls_fus_versions)
+    with profiler.stage('output'):
+        output_path = requirements.output(get_work_dir(), ls_fus_versions)
+    if args.results_db:
+        with profiler.stage('results_db'):
+            write_results_db(requirements, ls_fus_versions, output_path)
     print("Finished outputting")
+    return output_path
+
+
+def write_results_db(requirements: Requirements, ls_fus_versions: list, output_path: str) -> None:
+    results_db: ResultsDatabase = ResultsDatabase(os.path.join(get_work_dir(), 'Results', ResultsDatabase.DB_NAME))
+    try:
+        results_db.add_run(vendor, mr_model, field_strength, ls_fus_versions, requirements.get_results(), output_path)
+    except Exception as err:  # The output CSV is already written
+        logging.error(f"Failed to write results to: {results_db.db_path}, err: {err}, type: {type(err)}")
+    finally:
+        results_db.close()
 
 
 def restore_versions(backup: Backup):
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    dest_dir = os.path.join(script_dir, "Backup")
-    src_dir = "D:\\FusWs"
+    dest_dir = os.path.join(get_work_dir(), "Backup")
+    src_dir = args.root
     print("Start restoring")
     logging.info(f"Start to restore from {dest_dir} to {src_dir}")
     for fus_folder in ls_fus_versions:
         logging.info(f"Start to restore {fus_folder}")
-        backup.restore(fus_folder)
+        with profiler.stage('restore', fus_folder) as stage:
+            stage['files'] = backup.restore(fus_folder)
     logging.info("Restore is completed")
     print("Finished restoring")
 
 
-def read_user_response() -> None:
+def read_user_response(ask=input) -> None:  # ask shows the prompt and returns the answer, input() by default
     while True:
-        ans: str = input(f"Run XCom with these parameters and write ok to continue: {vendor}, {mr_model}, "
+        ans: str = ask(f"Run XCom with these parameters and write ok to continue: {vendor}, {mr_model}, "
                          f"{field_strength}, {ls_fus_versions}")
+        if not isinstance(ans, str):  # E.g. a client of the server sent something else
+            raise ValueError(f"The answer must be text, got: {type(ans)}")
         if ans.lower() == 'ok':
             print("Proceeding to validation")
             break
@@ -198,7 +396,7 @@ def read_user_response() -> None:
 # Main flow
 def map_versions(selected_versions: list) -> dict:
     logging.info(f"Starts mapping the following versions: {selected_versions}")
-    actual_versions = os.listdir("D:\\FusWs")
+    actual_versions = os.listdir(args.root)
     selected_versions.remove("CommonMR")
     selected_versions = [item+"_" for item in selected_versions]
     mapping = {key: [x for x in actual_versions if key in x][0] for key in selected_versions}
@@ -207,31 +405,137 @@ def map_versions(selected_versions: list) -> dict:
     return mapping
 
 
-def restore_folder_names(mapping: dict, backup: Backup) -> None:
+def restore_folder_names(mapping: dict, src_dir: str) -> None:
     for fus_version in mapping.keys():
-        os.rename(os.path.join(backup.src_dir, fus_version), os.path.join(backup.dest_dir, mapping[fus_version]))
+        if os.path.isdir(os.path.join(src_dir, fus_version)):  # Not renamed when the run failed before it
+            os.rename(os.path.join(src_dir, fus_version), os.path.join(src_dir, mapping[fus_version]))
+
+
+def write_profile(output_path: str) -> None:  # Run report next to the output CSV
+    report_path = os.path.splitext(output_path)[0] + '_profile.json'
+    profiler.write_report(report_path, {'vendor': vendor, 'mr_model': mr_model, 'field_strength': field_strength,
+                                        'versions': ls_fus_versions, 'jobs': args.jobs, 'ini_parser': args.ini_parser,
+                                        'log_level': args.log_level, 'time': datetime.now().isoformat()})
+    logging.info(f"Profile report is in: {report_path}")
+    profiler.reset()
 
 
-try:
-    define_log()
-    args = define_inputs()
-    df_req, files_to_skip_data, vendor, mr_model, field_strength, ls_fus_versions, backup_option = read_inputs(args)
-    df_filtered = filter_req(df_req)
+def run_parameters(ask=input, parsed_files: tuple = None) -> str:
+    # Run the flow for the current vendor, model, field and versions, returns the output CSV path
+    global mapping, manifests, backup_details, requirements
+    requirements = load_req()
+    if parsed_files is not None:  # INI and JSON files parsed by earlier runs of the server
+        requirements.set_parsed(*parsed_files)
     mapping = map_versions(ls_fus_versions)
-    rename_versions(ls_fus_versions)
-    if backup_option is None:  # Backup versions by default
-        backup_details = backup_versions()
-    requirements = parse_req()
-    set_default_values(ls_fus_versions)
-    read_user_response()
-    validate_versions(ls_fus_versions)
-    create_output(requirements, ls_fus_versions)
-    if backup_option is None:  # Restore files by default
-        # noinspection PyUnboundLocalVariable
-        restore_versions(backup_details)
-        restore_folder_names(mapping, backup_details)
+    backup_details = None
+    watcher = None
+    try:  # A failed run restores the versions too, a later run of the server finds them as they were
+        rename_versions(ls_fus_versions)
+        manifests = scan_versions(ls_fus_versions)
+        if backup_option is None:  # Backup versions by default
+            backup_details = backup_versions()
+        set_default_values(ls_fus_versions)
+        if args.watch:
+            watcher = start_watch(ls_fus_versions)
+        with profiler.stage('wait_for_xcom'):
+            read_user_response(ask)
+        if args.watch:
+            finish_watch(watcher)
+        else:
+            validate_versions(ls_fus_versions)
+        if parsed_files is None:  # Kept only by the server, for its next runs
+            requirements.clear_parsed()
+        output_path = create_output(requirements, ls_fus_versions)
+    finally:
+        if watcher is not None:  # Already stopped by finish_watch unless the run failed before it
+            watcher.cancel()
+        if backup_option is None:  # Restore files by default
+            if backup_details is not None:
+                restore_versions(backup_details)
+            restore_folder_names(mapping, args.root)
+    if profiler.enabled:
+        write_profile(output_path)
     print(f"The Run for these parameters was completed: {vendor}, {mr_model}, "
           f"{field_strength}, {ls_fus_versions}")
-except Exception as err:
-    logging.error(f"err: {err}, type: {type(err)}")
-    raise Exception("General exception")
+    return output_path
+
+
+def run_input_list(arguments: argparse.Namespace) -> None:  # Run every input.csv row in this process
+    global skip_index, vendor, mr_model, field_strength, ls_fus_versions, backup_option
+    logging.info(f"Files to skip was taken from: {arguments.input_not_null}")
+    skip_index = SkipIndex(get_files_to_skip(arguments.input_not_null))
+    backup_option = arguments.backup
+    failed_runs = []
+    for vendor, mr_model, field_strength, ls_fus_versions in read_input_list(arguments.input_list):
+        logging.info(f"Start run for: {vendor}, {mr_model}, {field_strength}, {ls_fus_versions}")
+        try:
+            check_versions_exist(ls_fus_versions)
+            run_parameters()
+        except Exception as err:  # Continue with the next row like a separate main.exe run would
+            logging.error(f"Run failed for: {vendor}, {mr_model}, {field_strength}, {ls_fus_versions}, err: {err}, "
+                          f"type: {type(err)}")
+            print(f"The Run for these parameters failed: {vendor}, {mr_model}, {field_strength}, {ls_fus_versions}")
+            failed_runs.append((vendor, mr_model, field_strength))
+    if failed_runs:
+        raise Exception(f"Runs failed for: {failed_runs}")
+
+
+def is_changed(path: str, mtimes: dict) -> bool:  # True on the first call for path and when its mtime changed
+    mtime_ns = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    changed = path not in mtimes or mtimes[path] != mtime_ns
+    mtimes[path] = mtime_ns
+    return changed
+
+
+def serve(arguments: argparse.Namespace) -> None:
+    # Run the requests of XpertClient.py one at a time, req.csv, filesToSkip.json and parsed files stay in memory
+    global df_req, req_index, skip_index, vendor, mr_model, field_strength, ls_fus_versions, backup_option
+    backup_option = arguments.backup
+    mtimes = {}  # mtime_ns of req.csv and filesToSkip.json when they were read
+    parsed_files = (OrderedDict(), OrderedDict())  # INI and JSON keys by content hash, bounded by MAX_PARSED_FILES
+    server: XpertServer = XpertServer(get_work_dir(), arguments.port)
+    server.start()
+    print(f"XPERT server is running on port {server.port}, run XpertClient.py to validate")
+    try:
+        for connection, request in server.requests():
+            vendor = mr_model = field_strength = ls_fus_versions = None  # Set only by a valid request
+            try:  # A bad request is answered with an error, the server keeps running
+                vendor, mr_model, field_strength, ls_fus_versions = XpertServer.get_run_parameters(request)
+                logging.info(f"Start run for: {vendor}, {mr_model}, {field_strength}, {ls_fus_versions}")
+                if is_changed(arguments.input_csv, mtimes):
+                    df_req, req_index = None, None  # Read again on first use
+                if is_changed(arguments.input_not_null, mtimes):
+                    logging.info(f"Files to skip was taken from: {arguments.input_not_null}")
+                    skip_index = SkipIndex(get_files_to_skip(arguments.input_not_null))
+                check_versions_exist(ls_fus_versions)
+                output_path = run_parameters(lambda prompt: XpertServer.ask(connection, prompt), parsed_files)
+                XpertServer.reply(connection, 'done', output_path)
+            except Exception as err:  # Serve the next request like a separate main.exe run would
+                logging.error(f"Run failed for: {vendor}, {mr_model}, {field_strength}, {ls_fus_versions}, err: {err}, "
+                              f"type: {type(err)}")
+                print(f"The Run for these parameters failed: {vendor}, {mr_model}, {field_strength}, {ls_fus_versions}")
+                XpertServer.reply(connection, 'error', f"{err}")
+    finally:
+        server.stop()
+    print("XPERT server stopped")
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Needed by worker processes of the frozen main.exe
+    try:
+        args = define_inputs()
+        log_config = define_log(get_work_dir(), args.log_level)
+        df_req, req_index = None, None  # Read on first use, see get_req()
+        profiler = RunProfiler(args.profile, args.profile_validate, args.profile_memory)
+        if args.serve:
+            serve(args)
+        elif args.input_list is None:
+            with profiler.stage('read_inputs'):
+                skip_index, vendor, mr_model, field_strength, ls_fus_versions, backup_option = read_inputs(
+                    args)
+            run_parameters()
+        else:
+            run_input_list(args)
+    except Exception as err:
+        logging.error(f"err: {err}, type: {type(err)}")
+        raise Exception("General exception")